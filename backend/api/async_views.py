@@ -0,0 +1,237 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import URLPattern
+from django.utils.cache import get_conditional_response
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from recipes import cache as recipe_cache
+from recipes.autocomplete import ingredient_index, search_ingredients_in_db
+from recipes.models import Ingredient, Recipe
+
+from .authentication import aget_user
+from .filters import RecipeFilter
+from .metrics import set_endpoint, track_serializer
+from .mixins import get_last_modified, make_etag, set_validators
+from .pagination import CustomPagination
+from .serializers import IngredientSerializer, RecipeReadSerializer
+from .views import (
+    INGREDIENT_STATE,
+    RECIPE_LIST_STATE,
+    RECIPE_STATE_FIELDS,
+    IngredientViewSet,
+    RecipeViewSet,
+    get_recipe_list_etag,
+    get_recipe_validators,
+)
+
+
+def render(data, headers=None):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        content_type='application/json',
+        headers=headers,
+    )
+
+
+async def aget_request(request):
+    user = await aget_user(request)
+    if user is None:
+        return None
+    drf_request = Request(request)
+    drf_request.user = user
+    return drf_request
+
+
+async def aload_subscriptions(request):
+    """Заполняет кэш подписок запроса до синхронной сериализации."""
+    user = request.user
+    if user.is_authenticated:
+        request.subscribed_author_ids = frozenset([
+            author_id async for author_id in
+            user.subscriptions.values_list('author_id', flat=True)
+        ])
+
+
+async def aget_conditional_response(
+    request, etag, last_modified, vary_headers, get_response
+):
+    last_modified = get_last_modified(request, last_modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = await get_response()
+    return set_validators(response, etag, last_modified, vary_headers)
+
+
+async def ingredient_list(request, format=None):
+    set_endpoint('ingredients.list')
+    request = format is None and await aget_request(request)
+    if not request:
+        return None
+    name = request.query_params.get('name', '')
+    if settings.INGREDIENT_INDEX_ENABLED:
+        state = await ingredient_index.aget_state()
+    else:
+        state = (
+            await Ingredient.objects.aaggregate(**INGREDIENT_STATE)
+        ).values()
+
+    async def get_response():
+        if settings.INGREDIENT_INDEX_ENABLED:
+            ingredients = await (
+                ingredient_index.asearch(name) if name
+                else ingredient_index.aall()
+            )
+        else:
+            queryset = Ingredient.objects.all()
+            if name:
+                queryset = search_ingredients_in_db(queryset, name)
+            ingredients = [ingredient async for ingredient in queryset]
+        with track_serializer():
+            data = IngredientSerializer(ingredients, many=True).data
+        return render(data)
+
+    return await aget_conditional_response(
+        request,
+        make_etag('ingredients', *state, request.GET.urlencode()),
+        None,
+        IngredientViewSet.vary_headers,
+        get_response,
+    )
+
+
+async def recipe_list(request, format=None):
+    set_endpoint('recipes.list')
+    request = format is None and await aget_request(request)
+    if not request:
+        return None
+    filterset = RecipeFilter(
+        request.query_params, queryset=Recipe.objects.all(), request=request
+    )
+    if not filterset.is_valid():
+        return None
+    state = await filterset.filter_queryset(
+        Recipe.objects.all()
+    ).aaggregate(**RECIPE_LIST_STATE)
+
+    async def get_response():
+        anonymous = not request.user.is_authenticated
+        if anonymous:
+            key, data = await sync_to_async(recipe_cache.get_list_data)(
+                request
+            )
+            if data is not None:
+                return render(data, {'X-Cache': 'HIT'})
+        paginator = CustomPagination()
+        page = await sync_to_async(paginator.paginate_queryset)(
+            filterset.filter_queryset(
+                RecipeViewSet.queryset.with_user_flags(request.user)
+            ),
+            request,
+        )
+        await aload_subscriptions(request)
+        with track_serializer():
+            data = paginator.get_paginated_response(RecipeReadSerializer(
+                page, many=True, context={'request': request}
+            ).data).data
+        if not anonymous:
+            return render(data)
+        await sync_to_async(recipe_cache.set_list_data)(key, data)
+        return render(data, {'X-Cache': 'MISS'})
+
+    return await aget_conditional_response(
+        request,
+        get_recipe_list_etag(request, state),
+        None,
+        RecipeViewSet.vary_headers,
+        get_response,
+    )
+
+
+async def recipe_detail(request, pk, format=None):
+    set_endpoint('recipes.retrieve')
+    request = (
+        format is None and pk.isdigit() and await aget_request(request)
+    )
+    if not request:
+        return None
+    pk = int(pk)
+    state = await Recipe.objects.filter(pk=pk).values_list(
+        *RECIPE_STATE_FIELDS
+    ).afirst()
+    if not state:
+        return None
+
+    async def get_response():
+        anonymous = not request.user.is_authenticated
+        if anonymous:
+            key, data = await sync_to_async(recipe_cache.get_detail_data)(
+                request, pk
+            )
+            if data is not None:
+                return render(data, {'X-Cache': 'HIT'})
+        recipe = await RecipeViewSet.queryset.with_user_flags(
+            request.user
+        ).filter(pk=pk).afirst()
+        if recipe is None:
+            raise NotFound
+        await aload_subscriptions(request)
+        with track_serializer():
+            data = RecipeReadSerializer(
+                recipe, context={'request': request}
+            ).data
+        if not anonymous:
+            return render(data)
+        await sync_to_async(recipe_cache.set_detail_data)(key, data)
+        return render(data, {'X-Cache': 'MISS'})
+
+    return await aget_conditional_response(
+        request,
+        *get_recipe_validators(request, pk, state),
+        RecipeViewSet.vary_headers,
+        get_response,
+    )
+
+
+def async_read_view(reader, fallback):
+    """Асинхронный GET с откатом на синхронное представление DRF.
+
+    Всё, что читатель не обработал (вернул None или поднял исключение
+    DRF), а также остальные методы обрабатывает исходный viewset.
+    """
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET':
+            try:
+                response = await reader(request, *args, **kwargs)
+            except APIException:
+                response = None
+            if response is not None:
+                return response
+        return await sync_to_async(fallback)(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+ASYNC_READERS = {
+    'ingredients-list': ingredient_list,
+    'recipes-list': recipe_list,
+    'recipes-detail': recipe_detail,
+}
+
+
+def with_async_readers(patterns):
+    return [
+        URLPattern(
+            pattern.pattern,
+            async_read_view(ASYNC_READERS[pattern.name], pattern.callback),
+            pattern.default_args,
+            pattern.name,
+        )
+        if getattr(pattern, 'name', None) in ASYNC_READERS else pattern
+        for pattern in patterns
+    ]
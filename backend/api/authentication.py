@@ -0,0 +1,202 @@
+import copy
+from collections import OrderedDict, defaultdict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import (
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.authtoken.models import Token
+
+GENERATION_CACHE_KEY = 'auth:token_user_generation:{}'
+
+
+def get_generation(user_id):
+    return cache.get_or_set(GENERATION_CACHE_KEY.format(user_id), 0, None)
+
+
+async def aget_generation(user_id):
+    return await cache.aget_or_set(
+        GENERATION_CACHE_KEY.format(user_id), 0, None
+    )
+
+
+def bump_generation(user_id):
+    key = GENERATION_CACHE_KEY.format(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        return 1
+
+
+class TokenCache:
+    """Токены и их пользователи в памяти процесса.
+
+    Запись живёт не дольше TOKEN_CACHE_TTL и сверяется с поколением
+    пользователя в кэше Django, поэтому выход, смена пароля или
+    деактивация в одном процессе видны остальным, если кэш общий.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._keys_by_user = defaultdict(set)
+
+    def _pop(self, key):
+        user, *_ = self._entries.pop(key)
+        keys = self._keys_by_user[user.pk]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_user[user.pk]
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[3] < monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+        return entry
+
+    def _check(self, key, entry, generation):
+        user, token, entry_generation, _ = entry
+        if entry_generation != generation:
+            self.forget_key(key)
+            return None
+        return copy.copy(user), token
+
+    def get(self, key):
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        return self._check(key, entry, get_generation(entry[0].pk))
+
+    async def aget(self, key):
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        return self._check(key, entry, await aget_generation(entry[0].pk))
+
+    def set(self, key, user, token, generation):
+        expires_at = monotonic() + settings.TOKEN_CACHE_TTL
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (
+                copy.copy(user), token, generation, expires_at
+            )
+            self._keys_by_user[user.pk].add(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._pop(next(iter(self._entries)))
+
+    def forget_key(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def forget_user(self, user_id):
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._pop(key)
+
+    def refresh_user(self, user, generation):
+        """Подменяет пользователя в записях процесса без нового запроса.
+
+        Запись обновляется, только если поколение с её чтения менялось
+        лишь этим сохранением; иначе она удаляется, чтобы не закрепить
+        чужое изменение, например деактивацию, устаревшими данными.
+        """
+        with self._lock:
+            for key in list(self._keys_by_user.get(user.pk, ())):
+                _, token, entry_generation, expires_at = self._entries[key]
+                if entry_generation == generation - 1:
+                    self._entries[key] = (
+                        copy.copy(user), token, generation, expires_at
+                    )
+                else:
+                    self._pop(key)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token, get_generation(user.pk))
+        return user, token
+
+
+async def aget_user(request):
+    """Пользователь по токену для асинхронных представлений.
+
+    Возвращает None, если токен не прошёл проверку: такой запрос
+    обрабатывает синхронное представление DRF с его сообщением об ошибке.
+    """
+    auth = get_authorization_header(request).split()
+    keyword = CachedTokenAuthentication.keyword.lower().encode()
+    if not auth or auth[0].lower() != keyword:
+        return AnonymousUser()
+    if len(auth) != 2:
+        return None
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        return None
+    cached = await token_cache.aget(key)
+    if cached is not None:
+        return cached[0]
+    token = await Token.objects.select_related('user').filter(
+        key=key
+    ).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    token_cache.set(
+        key, token.user, token, await aget_generation(token.user.pk)
+    )
+    return token.user
+
+
+# Поколение растёт после коммита: иначе другой процесс успел бы
+# перечитать ещё не изменённую строку и сохранить её с новым поколением.
+@receiver(post_delete, sender=Token)
+def forget_token(instance, **kwargs):
+    token_cache.forget_key(instance.key)
+    transaction.on_commit(lambda: bump_generation(instance.user_id))
+
+
+@receiver(post_delete, sender=get_user_model())
+def forget_user_tokens(instance, **kwargs):
+    token_cache.forget_user(instance.pk)
+    transaction.on_commit(lambda: bump_generation(instance.pk))
+
+
+@receiver(post_save, sender=get_user_model())
+def refresh_user_tokens(instance, created, **kwargs):
+    if created:
+        return
+
+    def refresh():
+        generation = bump_generation(instance.pk)
+        # Сохранение через touch() не должно выбивать собственную запись:
+        # в этом процессе она обновляется на месте.
+        if instance.is_active and not instance.get_deferred_fields():
+            token_cache.refresh_user(instance, generation)
+        else:
+            token_cache.forget_user(instance.pk)
+
+    transaction.on_commit(refresh)
@@ -1 +1,27 @@
 DEFAULT_PAGE_SIZE = 6
+SHOPPING_LIST_CHUNK_SIZE = 500
+SHOPPING_LIST_FILENAME = 'shopping_list'
+PAGINATION_QUERY_PARAM = 'pagination'
+CURSOR_PAGINATION_HEADER = 'X-Pagination'
+CURSOR_PAGINATION_VALUE = 'cursor'
+COUNT_QUERY_PARAM = 'count'
+APPROXIMATE_COUNT_VALUE = 'approx'
+IMAGE_VARIANTS_QUERY_PARAM = 'variants'
+IMAGE_VARIANT_FORMATS = (('WEBP', 'webp'), ('JPEG', 'jpg'))
+IMAGE_VARIANT_QUALITY = 80
+RECIPE_IMAGE_VARIANTS = {'thumbnail': (480, 480), 'detail': (1280, 1280)}
+AVATAR_IMAGE_VARIANTS = {'small': (64, 64)}
+BASE64_DECODE_CHUNK_SIZE = 64 * 1024
+IMAGE_UPLOAD_SPOOL_SIZE = 1024 * 1024
+IMAGE_UPLOAD_FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+    'BMP': 'bmp',
+}
+METRICS_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+RELATION_BATCH_MAX_SIZE = 100
@@ -1,31 +1,153 @@
 import base64
-import imghdr
+import binascii
 import uuid
+from tempfile import SpooledTemporaryFile
 
-import six
-
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
 from rest_framework import serializers
 
+from recipes.autocomplete import get_ingredients
+
+from .constants import (
+    BASE64_DECODE_CHUNK_SIZE,
+    IMAGE_UPLOAD_FORMATS,
+    IMAGE_UPLOAD_SPOOL_SIZE,
+)
+
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'image_too_large': 'Размер изображения не должен превышать '
+                           '{max_size} байт.',
+        'image_too_big': 'Изображение не должно быть больше '
+                         '{max_dimension}x{max_dimension} пикселей.',
+        'image_too_many_pixels': 'Изображение не должно содержать больше '
+                                 '{max_pixels} пикселей.',
+    }
+
     def to_internal_value(self, data):
-        if isinstance(data, six.string_types):
-            if 'data:' in data and ';base64,' in data:
-                _, data = data.split(';base64,')
+        if not isinstance(data, str):
+            return self._check_upload(data)
+        if 'data:' in data and ';base64,' in data:
+            _, data = data.split(';base64,', 1)
+
+        decoded_size = len(data) // 4 * 3 - data[-2:].count('=')
+        if decoded_size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.fail(
+                'image_too_large', max_size=settings.IMAGE_UPLOAD_MAX_BYTES
+            )
+
+        file = SpooledTemporaryFile(max_size=IMAGE_UPLOAD_SPOOL_SIZE)
+        try:
+            self._decode(data, file)
+            extension = self._check_image(file)
+        except serializers.ValidationError:
+            file.close()
+            raise
+        file.seek(0)
+        name = f'{str(uuid.uuid4())[:12]}.{extension}'
+        return serializers.FileField.to_internal_value(
+            self, File(file, name=name)
+        )
+
+    def _check_upload(self, file):
+        # Файл из multipart проходит те же проверки, что и base64.
+        file = serializers.FileField.to_internal_value(self, file)
+        if file.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.fail(
+                'image_too_large', max_size=settings.IMAGE_UPLOAD_MAX_BYTES
+            )
+        self._check_image(file)
+        file.seek(0)
+        return file
+
+    def _decode(self, data, file):
+        if len(data) % 4:
+            self.fail('invalid_image')
+        for start in range(0, len(data), BASE64_DECODE_CHUNK_SIZE):
             try:
-                decoded_file = base64.b64decode(data)
-            except TypeError:
+                file.write(base64.b64decode(
+                    data[start:start + BASE64_DECODE_CHUNK_SIZE],
+                    validate=True,
+                ))
+            except (binascii.Error, ValueError):
                 self.fail('invalid_image')
 
-            file_name = str(uuid.uuid4())[:12]
-            file_extension = self.get_file_extension(file_name, decoded_file)
-            complete_file_name = f'{file_name}.{file_extension}'
+    def _check_image(self, file):
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+                image_format = image.format
+                if max(width, height) > settings.IMAGE_UPLOAD_MAX_DIMENSION:
+                    self.fail(
+                        'image_too_big',
+                        max_dimension=settings.IMAGE_UPLOAD_MAX_DIMENSION,
+                    )
+                if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+                    self.fail(
+                        'image_too_many_pixels',
+                        max_pixels=settings.IMAGE_UPLOAD_MAX_PIXELS,
+                    )
+                image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        if image_format not in IMAGE_UPLOAD_FORMATS:
+            self.fail('invalid_image')
+        return IMAGE_UPLOAD_FORMATS[image_format]
+
+
+class ImageVariantsField(serializers.Field):
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        image = getattr(instance, self.image_field)
+        variants = getattr(instance, f'{self.image_field}_variants')
+        if not image or variants.get('source') != image.name:
+            return None
+        request = self.context.get('request')
+        return {
+            variant: {
+                extension: request.build_absolute_uri(image.storage.url(name))
+                for extension, name in files.items()
+            }
+            for variant, files in variants.items()
+            if variant != 'source'
+        }
 
-            data = ContentFile(decoded_file, name=complete_file_name)
 
-        return super().to_internal_value(data)
+class IngredientAmountListField(serializers.ListField):
+    """Список ингредиентов рецепта с количеством.
 
-    def get_file_extension(self, file_name, decoded_file):
-        extension = imghdr.what(file_name, decoded_file)
-        return 'jpg' if extension == 'jpeg' else extension
+    Все id проверяются разом: ингредиенты берутся из индекса в памяти
+    или одним запросом, а ошибка перечисляет все неизвестные id.
+    """
+
+    default_error_messages = {
+        'empty': 'Нужно добавить хотя бы один ингредиент.',
+        'duplicate': 'Ингредиенты не должны повторяться.',
+        'does_not_exist': 'Ингредиенты не найдены: {ids}.',
+    }
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        if not items:
+            self.fail('empty')
+        ingredient_ids = [item['id'] for item in items]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            self.fail('duplicate')
+        ingredients = get_ingredients(ingredient_ids)
+        missing_ids = [
+            str(pk) for pk in ingredient_ids if pk not in ingredients
+        ]
+        if missing_ids:
+            self.fail('does_not_exist', ids=', '.join(missing_ids))
+        for item in items:
+            item['id'] = ingredients[item['id']]
+        return items
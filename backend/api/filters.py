@@ -1,11 +1,7 @@
 from django_filters.rest_framework import CharFilter, FilterSet, filters
-from rest_framework.filters import SearchFilter
 
 from recipes.models import Ingredient, Recipe
-
-
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+from recipes.search import search_recipes
 
 
 class RecipeFilter(FilterSet):
@@ -14,10 +10,11 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'is_favorited', 'is_in_shopping_cart', 'search')
 
     def get_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -31,6 +28,9 @@ class RecipeFilter(FilterSet):
             return queryset.filter(in_shopping_cart__user=user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
 
 class IngredientFilter(FilterSet):
     name = CharFilter(lookup_expr='istartswith')
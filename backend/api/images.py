@@ -0,0 +1,90 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .constants import IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            thread_name_prefix='image-variants',
+        )
+    return _executor
+
+
+def _convert(image, image_format):
+    if image_format == 'JPEG':
+        return image.convert('RGB')
+    if image.mode in ('RGBA', 'LA', 'P'):
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def build_variants(storage, name, directory, sizes):
+    with storage.open(name) as file:
+        with Image.open(file) as image:
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = {'source': name}
+    for variant, size in sizes.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        variants[variant] = {}
+        for image_format, extension in IMAGE_VARIANT_FORMATS:
+            buffer = BytesIO()
+            _convert(resized, image_format).save(
+                buffer, image_format, quality=IMAGE_VARIANT_QUALITY
+            )
+            variant_name = os.path.join(
+                directory, f'{stem}_{variant}.{extension}'
+            )
+            variants[variant][extension] = storage.save(
+                variant_name, ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def _process(model, pk, field_name, name, sizes):
+    try:
+        field = model._meta.get_field(field_name)
+        variants = build_variants(
+            field.storage,
+            name,
+            os.path.join(field.upload_to, 'variants'),
+            sizes,
+        )
+        instance = model.objects.filter(pk=pk).first()
+        if instance is None or getattr(instance, field_name).name != name:
+            return
+        setattr(instance, f'{field_name}_variants', variants)
+        instance.save(update_fields=[f'{field_name}_variants', 'updated_at'])
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+    finally:
+        if settings.IMAGE_PROCESSING_ASYNC:
+            close_old_connections()
+
+
+def schedule_variants(instance, field_name, sizes):
+    name = getattr(instance, field_name).name
+    if not name:
+        return
+    args = (type(instance), instance.pk, field_name, name, sizes)
+    if settings.IMAGE_PROCESSING_ASYNC:
+        transaction.on_commit(lambda: _get_executor().submit(_process, *args))
+    else:
+        transaction.on_commit(lambda: _process(*args))
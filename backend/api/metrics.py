@@ -0,0 +1,264 @@
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+
+from recipes import cache as recipe_cache
+
+from .constants import METRICS_DURATION_BUCKETS, METRICS_QUERY_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = perf_counter()
+        self.endpoint = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    if settings.QUERY_BUDGET_RAISE:
+        # Запрос сверх бюджета падает до выполнения: начатая транзакция
+        # откатывается, а не сохраняется перед ответом с ошибкой.
+        message = get_budget_error(metrics.endpoint, metrics.queries + 1)
+        if message is not None:
+            metrics.queries += 1
+            raise QueryBudgetExceeded(message)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_time += perf_counter() - started
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def instrument_connection(connection, **kwargs):
+    install_query_recorder(connection)
+
+
+@contextmanager
+def track_serializer():
+    metrics = current_metrics.get()
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serializer_time += perf_counter() - started
+
+
+def set_endpoint(endpoint):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.endpoint = endpoint
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Гистограммы запросов по эндпоинтам в памяти процесса."""
+
+    metrics = (
+        ('request_duration_seconds', 'Время обработки запроса.',
+         METRICS_DURATION_BUCKETS),
+        ('sql_duration_seconds', 'Время SQL-запросов за запрос.',
+         METRICS_DURATION_BUCKETS),
+        ('serializer_duration_seconds', 'Время сериализации ответа.',
+         METRICS_DURATION_BUCKETS),
+        ('sql_queries', 'Число SQL-запросов за запрос.',
+         METRICS_QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = Lock()
+        self._histograms = defaultdict(dict)
+        self._budget_exceeded = defaultdict(int)
+
+    def observe(self, endpoint, metrics, total):
+        values = (total, metrics.sql_time, metrics.serializer_time,
+                  metrics.queries)
+        with self._lock:
+            for (metric, _, buckets), value in zip(self.metrics, values):
+                histograms = self._histograms[metric]
+                if endpoint not in histograms:
+                    histograms[endpoint] = Histogram(buckets)
+                histograms[endpoint].observe(value)
+
+    def budget_exceeded(self, endpoint):
+        with self._lock:
+            self._budget_exceeded[endpoint] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric, description, buckets in self.metrics:
+                name = f'foodgram_{metric}'
+                lines += [f'# HELP {name} {description}',
+                          f'# TYPE {name} histogram']
+                for endpoint, histogram in sorted(
+                    self._histograms[metric].items()
+                ):
+                    total = 0
+                    for bound, count in zip(
+                        (*buckets, '+Inf'), histogram.counts
+                    ):
+                        total += count
+                        lines.append(
+                            f'{name}_bucket{{endpoint="{endpoint}",'
+                            f'le="{bound}"}} {total}'
+                        )
+                    lines += [
+                        f'{name}_sum{{endpoint="{endpoint}"}} '
+                        f'{histogram.sum}',
+                        f'{name}_count{{endpoint="{endpoint}"}} {total}',
+                    ]
+            name = 'foodgram_query_budget_exceeded_total'
+            lines += [f'# HELP {name} Превышения бюджета SQL-запросов.',
+                      f'# TYPE {name} counter']
+            lines += [
+                f'{name}{{endpoint="{endpoint}"}} {count}'
+                for endpoint, count in sorted(self._budget_exceeded.items())
+            ]
+        for key, value in recipe_cache.get_stats().items():
+            name = f'foodgram_recipe_cache_{key}_total'
+            lines += [f'# TYPE {name} counter', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def get_budget_error(endpoint, queries):
+    budget = settings.QUERY_BUDGETS.get(endpoint)
+    if budget is None or queries <= budget:
+        return None
+    return f'{endpoint}: {queries} SQL-запросов при бюджете {budget}.'
+
+
+def check_query_budget(endpoint, queries):
+    message = get_budget_error(endpoint, queries)
+    if message is None:
+        return
+    registry.budget_exceeded(endpoint)
+    if settings.QUERY_BUDGET_RAISE:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class MetricsMiddleware:
+    """Число и время SQL-запросов, время сериализации и ответа.
+
+    Пишет заголовок Server-Timing, копит гистограммы для /api/_metrics
+    и проверяет бюджеты запросов из settings.QUERY_BUDGETS.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.process(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.process(request, response, metrics)
+
+    def process(self, request, response, metrics):
+        total = perf_counter() - metrics.started
+        endpoint = metrics.endpoint or (
+            request.resolver_match and request.resolver_match.view_name
+        )
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join((
+                f'db;desc="{metrics.queries} queries";'
+                f'dur={metrics.sql_time * 1000:.1f}',
+                f'serializer;dur={metrics.serializer_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ))
+        if endpoint and endpoint != 'metrics':
+            registry.observe(endpoint, metrics, total)
+            check_query_budget(endpoint, metrics.queries)
+        return response
+
+
+class MetricsMixin:
+    """Подписывает метрики действием viewset и замеряет сериализацию."""
+
+    def initial(self, request, *args, **kwargs):
+        set_endpoint(f'{self.basename}.{self.action}')
+        super().initial(request, *args, **kwargs)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        to_representation = serializer.to_representation
+
+        def timed_to_representation(instance):
+            with track_serializer():
+                return to_representation(instance)
+
+        serializer.to_representation = timed_to_representation
+        return serializer
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
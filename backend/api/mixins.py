@@ -0,0 +1,51 @@
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    digest = md5(
+        '|'.join(str(part) for part in parts).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def get_viewer_stamp(request):
+    user = request.user
+    if not user.is_authenticated:
+        return 'anonymous'
+    return f'{user.pk}:{user.updated_at.timestamp()}'
+
+
+def get_last_modified(request, last_modified):
+    if last_modified and request.user.is_authenticated:
+        last_modified = max(last_modified, request.user.updated_at)
+    return last_modified and int(last_modified.timestamp())
+
+
+def set_validators(response, etag, last_modified, vary_headers):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, vary_headers)
+    return response
+
+
+class ConditionalGetMixin:
+    vary_headers = ('Authorization',)
+
+    def get_conditional_response(
+        self, request, etag, last_modified, get_response
+    ):
+        last_modified = get_last_modified(request, last_modified)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = get_response()
+        return set_validators(
+            response, etag, last_modified, self.vary_headers
+        )
@@ -1,8 +1,69 @@
-from rest_framework.pagination import PageNumberPagination
+import json
 
-from .constants import DEFAULT_PAGE_SIZE
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from .constants import (
+    APPROXIMATE_COUNT_VALUE,
+    COUNT_QUERY_PARAM,
+    CURSOR_PAGINATION_HEADER,
+    CURSOR_PAGINATION_VALUE,
+    DEFAULT_PAGE_SIZE,
+    PAGINATION_QUERY_PARAM,
+)
+
+
+def is_cursor_mode(request):
+    mode = request.query_params.get(
+        PAGINATION_QUERY_PARAM,
+        request.headers.get(CURSOR_PAGINATION_HEADER),
+    )
+    return mode == CURSOR_PAGINATION_VALUE
+
+
+def estimate_count(queryset):
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CustomCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    page_size = DEFAULT_PAGE_SIZE
+    ordering = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if (
+            request.query_params.get(COUNT_QUERY_PARAM)
+            == APPROXIMATE_COUNT_VALUE
+        ):
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = {'count': self.count, **response.data}
+        return response
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = DEFAULT_PAGE_SIZE
+    cursor_pagination_class = CustomCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if is_cursor_mode(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
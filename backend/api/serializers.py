@@ -4,20 +4,51 @@ from django.db import transaction
 from rest_framework import serializers
 
 from recipes.models import (
-    Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
-    ShoppingCart,
+    ShoppingCartTotal,
 )
-from users.models import Subscription
 
-from .fields import Base64ImageField
+from .constants import (
+    AVATAR_IMAGE_VARIANTS,
+    IMAGE_VARIANTS_QUERY_PARAM,
+    RECIPE_IMAGE_VARIANTS,
+    RELATION_BATCH_MAX_SIZE,
+)
+from .fields import (
+    Base64ImageField,
+    ImageVariantsField,
+    IngredientAmountListField,
+)
+from .images import schedule_variants
 
 
 User = get_user_model()
 
 
+def get_subscribed_author_ids(request):
+    if not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, 'subscribed_author_ids'):
+        request.subscribed_author_ids = frozenset(
+            request.user.subscriptions.values_list('author_id', flat=True)
+        )
+    return request.subscribed_author_ids
+
+
+class ImageVariantsMixin:
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request and request.query_params.get(IMAGE_VARIANTS_QUERY_PARAM):
+            return fields
+        return {
+            name: field for name, field in fields.items()
+            if not isinstance(field, ImageVariantsField)
+        }
+
+
 class CustomUserCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -30,22 +61,19 @@ class CustomUserCreateSerializer(serializers.ModelSerializer):
         return User.objects.create_user(**validated_data)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField('avatar')
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
-            'is_subscribed', 'avatar',
+            'is_subscribed', 'avatar', 'avatar_variants',
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated
-            and Subscription.objects.filter(user=user, author=obj).exists()
-        )
+        return obj.id in get_subscribed_author_ids(self.context['request'])
 
 
 class AvatarSerializer(serializers.ModelSerializer):
@@ -55,6 +83,11 @@ class AvatarSerializer(serializers.ModelSerializer):
         model = User
         fields = ('avatar',)
 
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        schedule_variants(instance, 'avatar', AVATAR_IMAGE_VARIANTS)
+        return instance
+
 
 class SubscriptionListSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
@@ -65,17 +98,10 @@ class SubscriptionListSerializer(UserSerializer):
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-
-        recipes = obj.recipes.all()
-        if recipes_limit and recipes_limit.isdigit():
-            recipes = recipes[:int(recipes_limit)]
-
         return ShortRecipeSerializer(
-            recipes,
+            obj.limited_recipes,
             many=True,
-            context={'request': request},
+            context={'request': self.context.get('request')},
         ).data
 
 
@@ -95,25 +121,6 @@ class PasswordChangeSerializer(serializers.Serializer):
         user.save()
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Subscription
-        fields = ('user', 'author')
-
-    def validate(self, data):
-        user = data['user']
-        author = data['author']
-        if user == author:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя.'
-            )
-        if Subscription.objects.filter(user=user, author=author).exists():
-            raise serializers.ValidationError(
-                'Вы уже подписаны на этого пользователя.'
-            )
-        return data
-
-
 class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ingredient
@@ -134,7 +141,7 @@ class RecipeIngredientReadSerializer(serializers.ModelSerializer):
 
 
 class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=1)
 
     class Meta:
@@ -142,38 +149,30 @@ class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientReadSerializer(
         many=True, read_only=True, source='recipe_ingredients'
     )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True, default=False)
+    is_in_shopping_cart = serializers.BooleanField(
+        read_only=True, default=False
+    )
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
-        )
-
-    def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated
-            and Favorite.objects.filter(user=user, recipe=obj).exists()
-        )
-
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated
-            and ShoppingCart.objects.filter(user=user, recipe=obj).exists()
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time',
         )
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
-    ingredients = RecipeIngredientWriteSerializer(many=True)
+    ingredients = IngredientAmountListField(
+        child=RecipeIngredientWriteSerializer()
+    )
     image = Base64ImageField()
 
     class Meta:
@@ -182,18 +181,6 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'id', 'ingredients', 'name', 'image', 'text', 'cooking_time',
         )
 
-    def validate_ingredients(self, value):
-        if not value:
-            raise serializers.ValidationError(
-                'Нужно добавить хотя бы один ингредиент.'
-            )
-        ingredient_ids = [item['id'] for item in value]
-        if len(ingredient_ids) != len(set(ingredient_ids)):
-            raise serializers.ValidationError(
-                'Ингредиенты не должны повторяться.'
-            )
-        return value
-
     def validate(self, data):
         request = self.context.get('request')
         if request and request.method in ('PUT', 'PATCH'):
@@ -206,17 +193,33 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 })
         return data
 
-    def _add_ingredients(self, recipe, ingredients):
-        recipe.ingredients.clear()
-        ingredients_to_create = [
+    def _set_ingredients(self, recipe, amounts, old_rows=()):
+        """Пишет только разницу между старыми и новыми ингредиентами."""
+        old_rows = {row.ingredient_id: row for row in old_rows}
+        RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
-                recipe=recipe,
-                ingredient=ingredient_data['id'],
-                amount=ingredient_data['amount'],
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
             )
-            for ingredient_data in ingredients
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in old_rows
+        )
+        changed_rows = []
+        for ingredient_id, row in old_rows.items():
+            amount = amounts.get(ingredient_id, row.amount)
+            if amount != row.amount:
+                row.amount = amount
+                changed_rows.append(row)
+        RecipeIngredient.objects.bulk_update(changed_rows, ['amount'])
+        removed_ids = [
+            row.pk for ingredient_id, row in old_rows.items()
+            if ingredient_id not in amounts
         ]
-        RecipeIngredient.objects.bulk_create(ingredients_to_create)
+        if removed_ids:
+            RecipeIngredient.objects.filter(pk__in=removed_ids).delete()
+
+    @staticmethod
+    def _get_amounts(ingredients):
+        return {item['id'].id: item['amount'] for item in ingredients}
 
     @transaction.atomic
     def create(self, validated_data):
@@ -225,50 +228,66 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             author=self.context['request'].user,
             **validated_data
         )
-        self._add_ingredients(recipe, ingredients)
+        self._set_ingredients(recipe, self._get_amounts(ingredients))
+        schedule_variants(recipe, 'image', RECIPE_IMAGE_VARIANTS)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        self._add_ingredients(instance, ingredients)
-        return super().update(instance, validated_data)
+        amounts = self._get_amounts(validated_data.pop('ingredients'))
+        Recipe.objects.lock([instance.pk])
+        old_rows = list(instance.recipe_ingredients.select_for_update())
+        old_amounts = {row.ingredient_id: row.amount for row in old_rows}
+        self._set_ingredients(instance, amounts, old_rows)
+        ShoppingCartTotal.objects.change_recipe(
+            instance, old_amounts, amounts
+        )
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_variants(instance, 'image', RECIPE_IMAGE_VARIANTS)
+        return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.select_related('author').prefetch_related(
+            'recipe_ingredients__ingredient'
+        ).with_user_flags(request.user).get(pk=instance.pk)
         return RecipeReadSerializer(
             instance,
-            context={'request': self.context.get('request')},
+            context={'request': request},
         ).data
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = fields
 
 
-class FavoriteCartSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = None
-        fields = ('recipe',)
-
-    def __init__(self, *args, **kwargs):
-        model_class = kwargs.pop('model_class', None)
-        if model_class:
-            self.Meta.model = model_class
-        super().__init__(*args, **kwargs)
-
-    def validate_recipe(self, value):
-        user = self.context['request'].user
-        model = self.Meta.model
-        if model.objects.filter(user=user, recipe=value).exists():
+class RelationBatchSerializer(serializers.Serializer):
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=RELATION_BATCH_MAX_SIZE,
+        default=list,
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=RELATION_BATCH_MAX_SIZE,
+        default=list,
+    )
+
+    def validate(self, data):
+        # Повторы в запросе схлопываются с сохранением порядка.
+        data = {key: list(dict.fromkeys(ids)) for key, ids in data.items()}
+        if not data['add'] and not data['remove']:
             raise serializers.ValidationError(
-                'Рецепт уже добавлен.'
+                'Передайте id в add или remove.'
             )
-        return value
-
-    def create(self, validated_data):
-        validated_data['user'] = self.context['request'].user
-        return self.Meta.model.objects.create(**validated_data)
+        if set(data['add']) & set(data['remove']):
+            raise serializers.ValidationError(
+                'Один id нельзя одновременно добавить и удалить.'
+            )
+        return data
@@ -0,0 +1,110 @@
+import csv
+from tempfile import SpooledTemporaryFile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingCartTotal
+
+from .constants import SHOPPING_LIST_CHUNK_SIZE
+
+TITLE = 'Список покупок'
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+PDF_BUFFER_SIZE = 1024 * 1024
+PDF_READ_SIZE = 64 * 1024
+
+
+def get_shopping_list_items(user):
+    return ShoppingCartTotal.objects.filter(user=user).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        total_amount=F('amount'),
+    ).order_by('ingredient__name').iterator(
+        chunk_size=SHOPPING_LIST_CHUNK_SIZE
+    )
+
+
+def _format_line(item):
+    return (
+        f'{item["ingredient__name"]} '
+        f'({item["ingredient__measurement_unit"]})'
+        f' - {item["total_amount"]}'
+    )
+
+
+def render_txt(items):
+    yield f'{TITLE}:\n\n'
+    for item in items:
+        yield f'{_format_line(item)}\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(items):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for item in items:
+        yield writer.writerow((
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['total_amount'],
+        ))
+
+
+def _register_pdf_font():
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+        )
+
+
+def render_pdf(items):
+    _register_pdf_font()
+    with SpooledTemporaryFile(max_size=PDF_BUFFER_SIZE) as buffer:
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        _, height = A4
+        top = height - PDF_MARGIN
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        pdf.drawString(PDF_MARGIN, top, TITLE)
+        y = top - 2 * PDF_LINE_HEIGHT
+        for item in items:
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+                y = top
+            pdf.drawString(PDF_MARGIN, y, _format_line(item))
+            y -= PDF_LINE_HEIGHT
+        pdf.save()
+        buffer.seek(0)
+        while chunk := buffer.read(PDF_READ_SIZE):
+            yield chunk
+
+
+async def aiter_parts(parts):
+    """Отдаёт экспорт ASGI-серверу по частям, не собирая файл в памяти.
+
+    Каждая часть читается в потоке запроса, где открыт курсор базы.
+    """
+    next_part = sync_to_async(next)
+    while (part := await next_part(parts, None)) is not None:
+        yield part
+
+
+EXPORTERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'pdf': render_pdf,
+}
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import include, path
 
 from rest_framework.routers import DefaultRouter
 
+from .async_views import with_async_readers
+from .metrics import metrics_view
 from .views import (
     IngredientViewSet,
     RecipeViewSet,
@@ -14,7 +17,12 @@ router.register(r'users', UserViewSet, basename='users')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
 
+router_urls = router.urls
+if settings.ASGI_MODE:
+    router_urls = with_async_readers(router_urls)
+
 urlpatterns = [
+    path('_metrics', metrics_view, name='metrics'),
     path('users/me/avatar/', UserAvatarView.as_view(), name='user-avatar'),
     path(
         'auth/',
@@ -23,5 +31,5 @@ urlpatterns = [
             path('', include('djoser.urls.authtoken')),
         ]),
     ),
-    path('', include(router.urls)),
+    path('', include(router_urls)),
 ]
@@ -1,6 +1,12 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max, Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 
 from django_filters.rest_framework import DjangoFilterBackend
 
@@ -10,34 +16,91 @@ from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from recipes import cache as recipe_cache
+from recipes.autocomplete import ingredient_index, search_ingredients_in_db
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingCart,
+    ShoppingCartTotal,
 )
+from recipes.shortlinks import get_short_link
 from users.models import User, Subscription
 
-from .filters import IngredientSearchFilter, RecipeFilter
+from .constants import CURSOR_PAGINATION_HEADER, SHOPPING_LIST_FILENAME
+from .filters import RecipeFilter
+from .metrics import MetricsMixin
+from .mixins import ConditionalGetMixin, get_viewer_stamp, make_etag
 from .pagination import CustomPagination
 from .permissions import IsOwnerOrReadOnly
+from .renderers import (
+    CsvShoppingListRenderer,
+    PdfShoppingListRenderer,
+    TxtShoppingListRenderer,
+)
 from .serializers import (
     AvatarSerializer,
-    FavoriteCartSerializer,
     IngredientSerializer,
     PasswordChangeSerializer,
     RecipeReadSerializer,
     RecipeWriteSerializer,
+    RelationBatchSerializer,
     ShortRecipeSerializer,
     SubscriptionListSerializer,
-    SubscriptionSerializer,
     CustomUserCreateSerializer,
     UserSerializer,
 )
+from .shopping_list import EXPORTERS, aiter_parts, get_shopping_list_items
+
+
+INGREDIENT_STATE = {'count': Count('id'), 'last_id': Max('id')}
+RECIPE_LIST_STATE = {
+    'count': Count('id'),
+    'updated_at': Max('updated_at'),
+    'author_updated_at': Max('author__updated_at'),
+}
+RECIPE_STATE_FIELDS = ('updated_at', 'author__updated_at')
+
+
+def get_recipe_list_etag(request, state):
+    # Last-Modified у списка не отдаётся: max(updated_at) не меняется при
+    # удалении рецепта, а число рецептов в ETag — меняется.
+    return make_etag(
+        'recipes',
+        *state.values(),
+        request.GET.urlencode(),
+        request.headers.get(CURSOR_PAGINATION_HEADER),
+        get_viewer_stamp(request),
+    )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+def get_recipe_validators(request, pk, state):
+    return (
+        make_etag('recipe', pk, *state, get_viewer_stamp(request)),
+        max(state),
+    )
+
+
+def get_batch_results(ids, changed, found, statuses):
+    """Итог пакетной операции по каждому id в порядке запроса."""
+    changed_status, unchanged_status = statuses
+    return [
+        {
+            'id': pk,
+            'status': (
+                changed_status if pk in changed
+                else unchanged_status if pk in found
+                else 'not_found'
+            ),
+        }
+        for pk in ids
+    ]
+
+
+class UserViewSet(
+    MetricsMixin, ConditionalGetMixin, viewsets.ModelViewSet
+):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     pagination_class = CustomPagination
@@ -47,6 +110,8 @@ class UserViewSet(viewsets.ModelViewSet):
             return CustomUserCreateSerializer
         if self.action == 'subscriptions':
             return SubscriptionListSerializer
+        if self.action == 'subscribe_batch':
+            return RelationBatchSerializer
         return UserSerializer
 
     def get_permissions(self):
@@ -57,6 +122,20 @@ class UserViewSet(viewsets.ModelViewSet):
     def get_serializer_context(self):
         return {'request': self.request}
 
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        updated_at = pk.isdigit() and User.objects.filter(pk=pk).values_list(
+            'updated_at', flat=True
+        ).first()
+        if not updated_at:
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_conditional_response(
+            request,
+            make_etag('user', pk, updated_at, get_viewer_stamp(request)),
+            updated_at,
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -66,12 +145,23 @@ class UserViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED,
         )
 
+    def _get_authors_queryset(self):
+        recipes = Recipe.objects.all()
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes[:int(recipes_limit)]
+        return User.objects.annotate(
+            recipes_count=Count('recipes'),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        ).order_by('id')
+
     @action(
         detail=False, methods=['get'], permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
         user = request.user
-        authors = User.objects.filter(subscribers__user=user)
+        authors = self._get_authors_queryset().filter(subscribers__user=user)
         page = self.paginate_queryset(authors)
         serializer = self.get_serializer(
             page, many=True, context={'request': request}
@@ -84,16 +174,19 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscribe(self, request, pk=None):
-        author = get_object_or_404(User, id=pk)
-
         if request.method == 'POST':
-            data = {'user': request.user.id, 'author': author.id}
-            serializer = SubscriptionSerializer(
-                data=data,
-                context={'request': request},
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            author = get_object_or_404(self._get_authors_queryset(), id=pk)
+            if author == request.user:
+                return Response(
+                    {'errors': 'Нельзя подписаться на самого себя.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if not Subscription.objects.add(user=request.user, author=author):
+                return Response(
+                    {'errors': 'Вы уже подписаны на этого пользователя.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            request.user.touch()
             response_serializer = SubscriptionListSerializer(
                 author, context={'request': request}
             )
@@ -102,22 +195,64 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_201_CREATED,
             )
 
-        deleted_count, _ = Subscription.objects.filter(
-            user=request.user, author=author
-        ).delete()
-        if deleted_count == 0:
+        if not Subscription.objects.remove(user=request.user, author_id=pk):
+            get_object_or_404(User, id=pk)
             return Response(
                 {'errors': 'Вы не были подписаны на этого пользователя.'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        request.user.touch()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='subscribe/batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def subscribe_batch(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add_ids = serializer.validated_data['add']
+        remove_ids = serializer.validated_data['remove']
+        user = request.user
+        found = set(User.objects.filter(
+            pk__in=add_ids + remove_ids
+        ).values_list('id', flat=True))
+        with transaction.atomic():
+            added = Subscription.objects.add_many(
+                'author',
+                [pk for pk in add_ids if pk in found and pk != user.id],
+                user=user,
+            )
+            removed = Subscription.objects.remove_many(
+                'author', remove_ids, user=user
+            )
+        if added or removed:
+            user.touch()
+        add_results = get_batch_results(
+            add_ids, added, found, ('added', 'exists')
+        )
+        for result in add_results:
+            if result['id'] == user.id:
+                result['status'] = 'self'
+        return Response({
+            'add': add_results,
+            'remove': get_batch_results(
+                remove_ids, removed, found, ('removed', 'absent')
+            ),
+        })
+
     @action(
         detail=False, methods=['get'], permission_classes=(IsAuthenticated,)
     )
     def me(self, request):
-        serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        return self.get_conditional_response(
+            request,
+            make_etag('me', get_viewer_stamp(request)),
+            request.user.updated_at,
+            lambda: Response(self.get_serializer(request.user).data),
+        )
 
     @action(
         detail=False,
@@ -156,69 +291,219 @@ class UserAvatarView(views.APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def delete(self, request, *args, **kwargs):
-        request.user.avatar.delete(save=True)
+        # Файл может быть общим с другими пользователями: поле только
+        # очищается, а неиспользуемые файлы удаляет collect_media.
+        user = request.user
+        user.avatar = ''
+        user.avatar_variants = {}
+        user.save(update_fields=['avatar', 'avatar_variants', 'updated_at'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    MetricsMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
-    filter_backends = [IngredientSearchFilter]
-    search_fields = ('^name',)
     pagination_class = None
 
+    def _get_etag(self, *parts):
+        if settings.INGREDIENT_INDEX_ENABLED:
+            state = ingredient_index.get_state()
+        else:
+            state = Ingredient.objects.aggregate(**INGREDIENT_STATE).values()
+        return make_etag('ingredients', *state, *parts)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            request,
+            self._get_etag(request.GET.urlencode()),
+            None,
+            partial(self._list, request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            request,
+            self._get_etag(kwargs[self.lookup_field]),
+            None,
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
+    def _list(self, request, *args, **kwargs):
+        name = request.query_params.get('name', '')
+        if settings.INGREDIENT_INDEX_ENABLED:
+            ingredients = (
+                ingredient_index.search(name) if name
+                else ingredient_index.all()
+            )
+        else:
+            ingredients = self.get_queryset()
+            if name:
+                ingredients = search_ingredients_in_db(ingredients, name)
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(
+    MetricsMixin, ConditionalGetMixin, viewsets.ModelViewSet
+):
     queryset = Recipe.objects.select_related('author').prefetch_related(
         'recipe_ingredients__ingredient'
     ).order_by('id')
     permission_classes = (IsOwnerOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    vary_headers = ('Authorization', CURSOR_PAGINATION_HEADER)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return queryset.with_user_flags(self.request.user)
+        if self.action in ('update', 'partial_update', 'destroy'):
+            # Ингредиенты здесь пересоздаются или удаляются, а ответ
+            # изменения читает их заново.
+            return queryset.prefetch_related(None)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        state = self.filter_queryset(Recipe.objects.all()).aggregate(
+            **RECIPE_LIST_STATE
+        )
+        return self.get_conditional_response(
+            request,
+            get_recipe_list_etag(request, state),
+            None,
+            partial(self._list, request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        state = pk.isdigit() and Recipe.objects.filter(pk=pk).values_list(
+            *RECIPE_STATE_FIELDS
+        ).first()
+        if not state:
+            return self._retrieve(request, *args, **kwargs)
+        return self.get_conditional_response(
+            request,
+            *get_recipe_validators(request, pk, state),
+            partial(self._retrieve, request, *args, **kwargs),
+        )
+
+    def _list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key, data = recipe_cache.get_list_data(request)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        response = super().list(request, *args, **kwargs)
+        recipe_cache.set_list_data(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def _retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        if request.user.is_authenticated or not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        pk = int(pk)
+        key, data = recipe_cache.get_detail_data(request, pk)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        response = super().retrieve(request, *args, **kwargs)
+        recipe_cache.set_detail_data(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
         if self.action in ('favorite', 'shopping_cart'):
             return ShortRecipeSerializer
+        if self.action in ('favorite_batch', 'shopping_cart_batch'):
+            return RelationBatchSerializer
         return RecipeWriteSerializer
 
     def _manage_relation(self, model, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
         user = request.user
-        relation = model.objects.filter(user=user, recipe=recipe)
 
         if request.method == 'POST':
-            if relation.exists():
+            recipe = get_object_or_404(
+                Recipe.objects.only(*ShortRecipeSerializer.Meta.fields), pk=pk
+            )
+            with transaction.atomic():
+                if model is ShoppingCart:
+                    Recipe.objects.lock([recipe.pk])
+                added = model.objects.add(user=user, recipe=recipe)
+                if added and model is ShoppingCart:
+                    ShoppingCartTotal.objects.add_recipe(user, recipe)
+            if not added:
                 return Response(
                     {'errors': f'Рецепт уже в {model._meta.verbose_name}.'},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            serializer = FavoriteCartSerializer(
-                data={'recipe': recipe.id},
-                context={'request': request},
-                model_class=model,
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            user.touch()
             short_serializer = self.get_serializer(recipe)
             return Response(
                 short_serializer.data,
                 status=status.HTTP_201_CREATED,
             )
 
-        deleted_count, _ = relation.delete()
-        if deleted_count == 0:
+        with transaction.atomic():
+            if model is ShoppingCart:
+                Recipe.objects.lock([pk])
+            removed = model.objects.remove(user=user, recipe_id=pk)
+            if removed and model is ShoppingCart:
+                ShoppingCartTotal.objects.remove_recipe(user, Recipe(pk=pk))
+        if not removed:
+            # Отличаем несуществующий рецепт только на пути ошибки.
+            get_object_or_404(Recipe, pk=pk)
             return Response(
                 {'errors': f'Рецепта нет в {model._meta.verbose_name}.'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        user.touch()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def _manage_relations(self, model, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add_ids = serializer.validated_data['add']
+        remove_ids = serializer.validated_data['remove']
+        user = request.user
+        found = set(Recipe.objects.filter(
+            pk__in=add_ids + remove_ids
+        ).values_list('id', flat=True))
+        with transaction.atomic():
+            if model is ShoppingCart:
+                Recipe.objects.lock(found)
+            added = model.objects.add_many(
+                'recipe', [pk for pk in add_ids if pk in found], user=user
+            )
+            removed = model.objects.remove_many(
+                'recipe', remove_ids, user=user
+            )
+            if model is ShoppingCart and (added or removed):
+                ShoppingCartTotal.objects.change_cart(user, added, removed)
+        if added or removed:
+            user.touch()
+        return Response({
+            'add': get_batch_results(
+                add_ids, added, found, ('added', 'exists')
+            ),
+            'remove': get_batch_results(
+                remove_ids, removed, found, ('removed', 'absent')
+            ),
+        })
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
-        return Response({'short-link': request.build_absolute_uri()})
+        link = get_short_link(get_object_or_404(Recipe, pk=pk))
+        return Response({
+            'short-link': request.build_absolute_uri(
+                reverse('short-link', args=(link.code,))
+            ),
+        })
 
     @action(
         detail=True,
@@ -236,39 +521,48 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk=None):
         return self._manage_relation(ShoppingCart, request, pk)
 
-    def _generate_shopping_list_text(self, user):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__in_shopping_cart__user=user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit',
-        ).annotate(
-            total_amount=Sum('amount')
-        ).order_by('ingredient__name')
-
-        shopping_list = 'Список покупок:\n\n'
-        for item in ingredients:
-            shopping_list += (
-                f'{item["ingredient__name"]} '
-                f'({item["ingredient__measurement_unit"]})'
-                f' - {item["total_amount"]}\n'
-            )
-        return shopping_list
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_batch(self, request):
+        return self._manage_relations(Favorite, request)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_batch(self, request):
+        return self._manage_relations(ShoppingCart, request)
 
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated],
+        renderer_classes=(
+            TxtShoppingListRenderer,
+            CsvShoppingListRenderer,
+            PdfShoppingListRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        shopping_list = self._generate_shopping_list_text(request.user)
-
-        response = HttpResponse(
-            shopping_list,
-            content_type='text/plain; charset=utf-8',
+        renderer = request.accepted_renderer
+        content = EXPORTERS[renderer.format](
+            get_shopping_list_items(request.user)
         )
+        if isinstance(request._request, ASGIRequest):
+            content = aiter_parts(content)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+
+        response = StreamingHttpResponse(content, content_type=content_type)
         response['Content-Disposition'] = (
             'attachment; '
-            'filename="shopping_list.txt"'
+            f'filename="{SHOPPING_LIST_FILENAME}.{renderer.format}"'
         )
         return response
@@ -0,0 +1,75 @@
+from django.db import connections, models, transaction
+from django.db.models.constants import OnConflict
+from django.db.models.sql import InsertQuery
+
+
+class RelationQuerySet(models.QuerySet):
+    """Связи с уникальной парой полей, которые переключаются одним запросом.
+
+    Проверка «уже есть / ещё нет» делается самой базой по уникальному
+    ограничению, поэтому параллельные запросы не дают дублей и ошибок 500.
+    Сигналы моделей не отправляются: побочные эффекты ведёт вызывающий код.
+    """
+
+    def _insert_ignore(self, objs, returning_fields=None):
+        self._for_write = True
+        opts = self.model._meta
+        query = InsertQuery(self.model, on_conflict=OnConflict.IGNORE)
+        query.insert_values(
+            [field for field in opts.concrete_fields
+             if field is not opts.auto_field],
+            objs,
+        )
+        compiler = query.get_compiler(self.db)
+        compiler.returning_fields = returning_fields
+        with connections[self.db].cursor() as cursor:
+            for sql, params in compiler.as_sql():
+                cursor.execute(sql, params)
+            if returning_fields:
+                return cursor.fetchall()
+            return cursor.rowcount
+
+    def add(self, **fields):
+        """INSERT ... ON CONFLICT DO NOTHING, True — если строка вставлена."""
+        return self._insert_ignore([self.model(**fields)]) > 0
+
+    def add_many(self, field_name, values, **fields):
+        """Вставляет пачку связей, возвращает значения вставленных строк."""
+        if not values:
+            return set()
+        field = self.model._meta.get_field(field_name)
+        features = connections[self.db].features
+        if not features.can_return_rows_from_bulk_insert:
+            return {
+                value for value in values
+                if self.add(**fields, **{field.attname: value})
+            }
+        rows = self._insert_ignore(
+            [
+                self.model(**fields, **{field.attname: value})
+                for value in values
+            ],
+            returning_fields=[field],
+        )
+        return {value for value, in rows}
+
+    def _delete(self, **fields):
+        # На связи ничего не ссылается, поэтому каскад собирать не нужно.
+        return self.filter(**fields)._raw_delete(self.db)
+
+    def remove(self, **fields):
+        """Один DELETE, True — если строка была удалена."""
+        return self._delete(**fields) > 0
+
+    def remove_many(self, field_name, values, **fields):
+        """Удаляет пачку связей, возвращает значения удалённых строк."""
+        if not values:
+            return set()
+        queryset = self.filter(**fields, **{f'{field_name}__in': values})
+        with transaction.atomic(using=self.db):
+            removed = set(queryset.select_for_update().values_list(
+                field_name, flat=True
+            ))
+            if removed:
+                self._delete(**fields, **{f'{field_name}__in': removed})
+        return removed
@@ -10,6 +10,8 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 
 DEBUG = os.getenv('DEBUG', '0') == '1'
 
+ASGI_MODE = os.getenv('ASGI_MODE', '0') == '1'
+
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',')
 
 INSTALLED_APPS = [
@@ -29,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -60,6 +63,8 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 
 if os.getenv('DB_ENGINE') == 'django.db.backends.postgresql':
+    DB_POOLER = os.getenv('DB_POOLER', '0') == '1'
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
     DATABASES = {
         'default': {
             'ENGINE': os.getenv('DB_ENGINE'),
@@ -68,8 +73,24 @@ if os.getenv('DB_ENGINE') == 'django.db.backends.postgresql':
             'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
             'HOST': os.getenv('DB_HOST'),
             'PORT': os.getenv('DB_PORT'),
+            # Под ASGI постоянные соединения не переиспользуются между
+            # запросами, поэтому по умолчанию они выключены.
+            'CONN_MAX_AGE': int(
+                os.getenv('DB_CONN_MAX_AGE', 0 if ASGI_MODE else 60)
+            ),
+            'CONN_HEALTH_CHECKS': (
+                os.getenv('DB_CONN_HEALTH_CHECKS', '1') == '1'
+            ),
+            # PgBouncer в режиме transaction не держит курсоры между
+            # транзакциями и не принимает параметр options при подключении.
+            'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER,
+            'OPTIONS': {},
         }
     }
+    if DB_STATEMENT_TIMEOUT and not DB_POOLER:
+        DATABASES['default']['OPTIONS']['options'] = (
+            f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+        )
 else:
     DATABASES = {
         'default': {
@@ -78,6 +99,23 @@ else:
         }
     }
 
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+RECIPE_CACHE_ALIAS = 'default'
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 300))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,6 +142,42 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'foodgram.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+INGREDIENT_INDEX_ENABLED = os.getenv('INGREDIENT_INDEX_ENABLED', '1') == '1'
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+INGREDIENT_SEARCH_SUBSTRING = (
+    os.getenv('INGREDIENT_SEARCH_SUBSTRING', '0') == '1'
+)
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv('IMAGE_UPLOAD_MAX_BYTES', 5 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_DIMENSION = int(os.getenv('IMAGE_UPLOAD_MAX_DIMENSION', 8000))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000))
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_UPLOAD_MAX_BYTES * 4 // 3 + 64 * 1024
+
+IMAGE_PROCESSING_ASYNC = os.getenv('IMAGE_PROCESSING_ASYNC', '1') == '1'
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+SHORT_LINK_HITS_FLUSH_INTERVAL = int(
+    os.getenv('SHORT_LINK_HITS_FLUSH_INTERVAL', 10)
+)
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
@@ -113,7 +187,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
     'PAGE_SIZE': 6,
@@ -129,6 +203,39 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'api.utils.custom_exception_handler',
 }
 
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 60))
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') == '1'
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',')
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE', '0') == '1'
+# Замерено с пустым кэшем токенов: первый запрос процесса с токеном
+# тратит на пользователя лишний запрос.
+QUERY_BUDGETS = {
+    'ingredients.list': 2,
+    'ingredients.retrieve': 2,
+    'recipes.list': 7,
+    'recipes.retrieve': 6,
+    'recipes.create': 12,
+    'recipes.update': 23,
+    'recipes.partial_update': 23,
+    'recipes.destroy': 19,
+    'recipes.favorite': 6,
+    'recipes.shopping_cart': 11,
+    'recipes.favorite_batch': 9,
+    'recipes.shopping_cart_batch': 18,
+    'recipes.get_link': 5,
+    'recipes.download_shopping_cart': 2,
+    'users.list': 4,
+    'users.retrieve': 4,
+    'users.create': 4,
+    'users.me': 2,
+    'users.set_password': 3,
+    'users.subscriptions': 5,
+    'users.subscribe': 6,
+    'users.subscribe_batch': 8,
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
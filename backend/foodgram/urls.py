@@ -3,9 +3,19 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from recipes.views import async_short_link_redirect, short_link_redirect
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path(
+        's/<str:code>/',
+        (
+            async_short_link_redirect if settings.ASGI_MODE
+            else short_link_redirect
+        ),
+        name='short-link',
+    ),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,9 @@
+import os
+
+bind = '0.0.0.0:8000'
+
+if os.getenv('ASGI_MODE', '0') == '1':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
@@ -6,6 +6,8 @@ from .models import (
     Favorite,
     ShoppingCart,
     RecipeIngredient,
+    ShoppingCartTotal,
+    ShortLink,
 )
 
 
@@ -35,3 +37,20 @@ class FavoriteAdmin(admin.ModelAdmin):
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+
+    def delete_queryset(self, request, queryset):
+        # Итоги списков покупок пересчитываются сигналом на каждую строку.
+        for cart in queryset:
+            cart.delete()
+
+
+@admin.register(ShoppingCartTotal)
+class ShoppingCartTotalAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+    list_filter = ('user',)
+
+
+@admin.register(ShortLink)
+class ShortLinkAdmin(admin.ModelAdmin):
+    list_display = ('code', 'recipe', 'hits')
+    search_fields = ('code', 'recipe__name')
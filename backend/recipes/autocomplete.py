@@ -0,0 +1,161 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Upper
+
+from .models import Ingredient
+
+INDEX_VERSION_CACHE_KEY = 'recipes:ingredient_index_version'
+
+EXACT, PREFIX, SUBSTRING = range(3)
+
+
+class IngredientIndex:
+    """Отсортированный индекс ингредиентов в памяти процесса.
+
+    Строится при первом обращении и сбрасывается при изменении
+    ингредиентов. Версия индекса хранится в кэше Django, поэтому сброс
+    в одном процессе виден остальным, если кэш общий.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._by_id = []
+        self._by_pk = {}
+        self._keys = []
+        self._by_name = []
+
+    def _get_version(self):
+        return cache.get_or_set(INDEX_VERSION_CACHE_KEY, 0, None)
+
+    def invalidate(self):
+        try:
+            cache.incr(INDEX_VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(INDEX_VERSION_CACHE_KEY, 1, None)
+        with self._lock:
+            self._version = None
+
+    def _build(self, version, ingredients):
+        with self._lock:
+            if self._version == version:
+                return
+            by_id = list(ingredients)
+            by_name = sorted(
+                by_id, key=lambda ingredient: ingredient.name.casefold()
+            )
+            self._by_id = by_id
+            self._by_pk = {ingredient.pk: ingredient for ingredient in by_id}
+            self._by_name = by_name
+            self._keys = [ingredient.name.casefold() for ingredient in by_name]
+            self._version = version
+
+    def _ensure_built(self):
+        version = self._get_version()
+        if self._version != version:
+            self._build(version, Ingredient.objects.order_by('id'))
+
+    async def _aensure_built(self):
+        version = await cache.aget_or_set(INDEX_VERSION_CACHE_KEY, 0, None)
+        if self._version != version:
+            self._build(version, [
+                ingredient
+                async for ingredient in Ingredient.objects.order_by('id')
+            ])
+
+    def get_state(self):
+        self._ensure_built()
+        return self._version, len(self._by_id)
+
+    async def aget_state(self):
+        await self._aensure_built()
+        return self._version, len(self._by_id)
+
+    def all(self):
+        self._ensure_built()
+        return list(self._by_id)
+
+    async def aall(self):
+        await self._aensure_built()
+        return list(self._by_id)
+
+    def get_many(self, ids):
+        self._ensure_built()
+        by_pk = self._by_pk
+        return {pk: by_pk[pk] for pk in ids if pk in by_pk}
+
+    def search(self, term, limit=None, substring=None):
+        self._ensure_built()
+        return self._search(term, limit, substring)
+
+    async def asearch(self, term, limit=None, substring=None):
+        await self._aensure_built()
+        return self._search(term, limit, substring)
+
+    def _search(self, term, limit, substring):
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        if substring is None:
+            substring = settings.INGREDIENT_SEARCH_SUBSTRING
+        keys, by_name = self._keys, self._by_name
+        term = term.casefold()
+
+        start = bisect_left(keys, term)
+        end = bisect_left(keys, term + '\U0010ffff', lo=start)
+        results = [
+            by_name[position] for position in range(start, end)
+            if keys[position] == term
+        ]
+        results += [
+            by_name[position] for position in range(start, end)
+            if keys[position] != term
+        ][:limit - len(results)]
+        if substring and len(results) < limit:
+            results += [
+                ingredient
+                for key, ingredient in zip(keys, by_name)
+                if term in key and not key.startswith(term)
+            ][:limit - len(results)]
+        return results[:limit]
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_ingredients_in_db(queryset, term, limit=None, substring=None):
+    limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+    if substring is None:
+        substring = settings.INGREDIENT_SEARCH_SUBSTRING
+    term = term.upper()
+    condition = Q(name_upper__startswith=term)
+    if substring:
+        condition |= Q(name_upper__contains=term)
+    return queryset.annotate(name_upper=Upper('name')).filter(
+        condition
+    ).annotate(
+        rank=Case(
+            When(name_upper=term, then=Value(EXACT)),
+            When(name_upper__startswith=term, then=Value(PREFIX)),
+            default=Value(SUBSTRING),
+            output_field=IntegerField(),
+        )
+    ).order_by('rank', 'name')[:limit]
+
+
+def get_ingredients(ids):
+    """Ингредиенты по id: из индекса в памяти, недостающие — одним запросом.
+
+    Индекс другого процесса может отстать от базы, поэтому id, которых
+    в нём нет, всё равно проверяются в базе.
+    """
+    ingredients = (
+        ingredient_index.get_many(ids)
+        if settings.INGREDIENT_INDEX_ENABLED else {}
+    )
+    missing_ids = [pk for pk in ids if pk not in ingredients]
+    if missing_ids:
+        ingredients.update(Ingredient.objects.in_bulk(missing_ids))
+    return ingredients
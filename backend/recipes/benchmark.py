@@ -0,0 +1,276 @@
+"""Нагрузочные сценарии API на asyncio без сторонних зависимостей."""
+import asyncio
+import json
+import os
+import random
+import re
+import tempfile
+from collections import defaultdict
+from statistics import mean, quantiles
+from time import monotonic, perf_counter
+from urllib.parse import quote, urlsplit
+
+DEFAULT_TOKENS_PATH = os.path.join(
+    tempfile.gettempdir(), 'foodgram_benchmark_tokens.json'
+)
+DEFAULT_MIX = {'feed': 50, 'autocomplete': 30, 'cart': 10, 'subscribe': 10}
+SERVER_TIMING_QUERIES = re.compile(r'db;desc="(\d+) queries"')
+PERCENTILES = (50, 90, 95, 99)
+
+
+class HttpClient:
+    """HTTP/1.1 keep-alive соединение одного виртуального пользователя."""
+
+    def __init__(self, url, token=None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.base_path = parts.path.rstrip('/')
+        self.token = token
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, method, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        lines = [
+            f'{method} {self.base_path}{path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'Accept: */*',
+            'Content-Length: 0',
+        ]
+        if self.token:
+            lines.append(f'Authorization: Token {self.token}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            body = await self.reader.readexactly(
+                int(headers['content-length'])
+            )
+        elif headers.get('transfer-encoding') == 'chunked':
+            body = await self._read_chunked()
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, headers, body
+
+    async def _read_chunked(self):
+        body = b''
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if not size:
+                await self.reader.readline()
+                return body
+            body += await self.reader.readexactly(size)
+            await self.reader.readline()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    async def call(self, client, name, method, path):
+        started = perf_counter()
+        try:
+            status, headers, body = await client.request(method, path)
+        except (OSError, asyncio.IncompleteReadError, ValueError,
+                IndexError):
+            await client.close()
+            self.errors[name] += 1
+            return None, None
+        self.latencies[name].append(perf_counter() - started)
+        self.statuses[name][status] += 1
+        if status >= 500:
+            self.errors[name] += 1
+        match = SERVER_TIMING_QUERIES.search(
+            headers.get('server-timing', '')
+        )
+        if match:
+            self.queries[name].append(int(match.group(1)))
+        return status, body
+
+
+def loads(body):
+    try:
+        return json.loads(body)
+    except (TypeError, ValueError):
+        return None
+
+
+async def feed(client, recorder, context, rng):
+    status, body = await recorder.call(
+        client, 'recipes.list', 'GET',
+        f'/api/recipes/?page={rng.randint(1, context["pages"])}',
+    )
+    results = (status == 200 and loads(body) or {}).get('results') or []
+    for recipe in rng.sample(results, min(2, len(results))):
+        await recorder.call(
+            client, 'recipes.retrieve', 'GET', f'/api/recipes/{recipe["id"]}/'
+        )
+
+
+async def autocomplete(client, recorder, context, rng):
+    name = rng.choice(context['ingredient_names'])
+    for length in range(1, min(len(name), 5) + 1):
+        await recorder.call(
+            client, 'ingredients.list', 'GET',
+            f'/api/ingredients/?name={quote(name[:length])}',
+        )
+
+
+async def cart(client, recorder, context, rng):
+    recipe_id = rng.choice(context['recipe_ids'])
+    path = f'/api/recipes/{recipe_id}/shopping_cart/'
+    await recorder.call(client, 'recipes.shopping_cart', 'POST', path)
+    await recorder.call(
+        client, 'recipes.download_shopping_cart', 'GET',
+        '/api/recipes/download_shopping_cart/',
+    )
+    await recorder.call(client, 'recipes.shopping_cart', 'DELETE', path)
+
+
+async def subscribe(client, recorder, context, rng):
+    author_id = rng.choice(context['author_ids'])
+    path = f'/api/users/{author_id}/subscribe/'
+    await recorder.call(client, 'users.subscribe', 'POST', path)
+    await recorder.call(
+        client, 'users.subscriptions', 'GET',
+        '/api/users/subscriptions/?recipes_limit=3',
+    )
+    await recorder.call(client, 'users.subscribe', 'DELETE', path)
+
+
+SCENARIOS = {
+    'feed': feed,
+    'autocomplete': autocomplete,
+    'cart': cart,
+    'subscribe': subscribe,
+}
+AUTHENTICATED_SCENARIOS = ('cart', 'subscribe')
+
+
+async def load_context(url):
+    client = HttpClient(url)
+    try:
+        _, _, body = await client.request('GET', '/api/ingredients/')
+        ingredient_names = [item['name'] for item in loads(body) or []]
+        _, _, body = await client.request('GET', '/api/recipes/?limit=100')
+        recipes = loads(body) or {}
+    finally:
+        await client.close()
+    if not ingredient_names or not recipes.get('results'):
+        raise ValueError('No ingredients or recipes, seed the database first')
+    return {
+        'ingredient_names': ingredient_names,
+        'recipe_ids': [recipe['id'] for recipe in recipes['results']],
+        'author_ids': list({
+            recipe['author']['id'] for recipe in recipes['results']
+        }),
+        'pages': max(1, min(recipes['count'] // 6, 50)),
+    }
+
+
+async def virtual_user(url, token, mix, context, recorder, deadline, seed):
+    rng = random.Random(seed)
+    client = HttpClient(url, token)
+    names = [
+        name for name in mix
+        if token or name not in AUTHENTICATED_SCENARIOS
+    ]
+    weights = [mix[name] for name in names]
+    if not names:
+        return
+    try:
+        while monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            await SCENARIOS[name](client, recorder, context, rng)
+    finally:
+        await client.close()
+
+
+async def run(url, tokens, mix, duration, concurrency, anonymous, seed=0):
+    context = await load_context(url)
+    recorder = Recorder()
+    deadline = monotonic() + duration
+    anonymous_users = round(concurrency * anonymous)
+    started = perf_counter()
+    await asyncio.gather(*(
+        virtual_user(
+            url,
+            None if number < anonymous_users or not tokens
+            else tokens[number % len(tokens)],
+            mix, context, recorder, deadline, seed + number,
+        )
+        for number in range(concurrency)
+    ))
+    return summarize(recorder, perf_counter() - started)
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return dict.fromkeys(PERCENTILES, values[0] if values else 0)
+    cuts = quantiles(values, n=100, method='inclusive')
+    return {percent: cuts[percent - 1] for percent in PERCENTILES}
+
+
+def summarize(recorder, elapsed):
+    results = {}
+    for name, latencies in sorted(recorder.latencies.items()):
+        queries = recorder.queries.get(name)
+        results[name] = {
+            'requests': len(latencies),
+            'errors': recorder.errors.get(name, 0),
+            'rps': round(len(latencies) / elapsed, 2),
+            'mean_ms': round(mean(latencies) * 1000, 2),
+            **{
+                f'p{percent}_ms': round(value * 1000, 2)
+                for percent, value in percentiles(latencies).items()
+            },
+            'queries': round(mean(queries), 2) if queries else None,
+            'statuses': dict(sorted(recorder.statuses[name].items())),
+        }
+    return {'elapsed': round(elapsed, 2), 'endpoints': results}
+
+
+def compare(results, baseline, tolerance):
+    """Регрессии относительно базовой линии: p95 и число запросов к БД."""
+    regressions = []
+    for name, current in results['endpoints'].items():
+        previous = baseline['endpoints'].get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p95 {current["p95_ms"]} ms, '
+                f'baseline {previous["p95_ms"]} ms'
+            )
+        if (
+            current['queries'] is not None
+            and previous['queries'] is not None
+            and current['queries'] > previous['queries'] + 0.5
+        ):
+            regressions.append(
+                f'{name}: {current["queries"]} queries per request, '
+                f'baseline {previous["queries"]}'
+            )
+    return regressions
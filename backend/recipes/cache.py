@@ -0,0 +1,125 @@
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+CACHE_PREFIX = 'recipes:response'
+LIST_VERSION_KEY = f'{CACHE_PREFIX}:list_version'
+HITS_KEY = f'{CACHE_PREFIX}:hits'
+MISSES_KEY = f'{CACHE_PREFIX}:misses'
+LIST_QUERY_PARAMS = (
+    'author', 'count', 'cursor', 'limit', 'page', 'pagination', 'search',
+    'variants',
+)
+DETAIL_QUERY_PARAMS = ('variants',)
+LIST_HEADERS = ('X-Pagination',)
+
+
+def get_cache():
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def _get_origin(request):
+    return f'{request.scheme}://{request.get_host()}'
+
+
+def _get_representation(request):
+    query = urlencode(sorted(
+        (param, value)
+        for param in DETAIL_QUERY_PARAMS
+        for value in request.query_params.getlist(param)
+    ))
+    return f'{_get_origin(request)}?{query}'
+
+
+def _increment(key):
+    cache = get_cache()
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        return 1
+
+
+def get_list_data(request):
+    cache = get_cache()
+    version = cache.get_or_set(LIST_VERSION_KEY, 0, None)
+    query = urlencode(sorted(
+        (param, value)
+        for param in LIST_QUERY_PARAMS
+        for value in request.query_params.getlist(param)
+    ))
+    headers = '|'.join(
+        request.headers.get(header, '') for header in LIST_HEADERS
+    )
+    digest = md5(
+        f'{_get_origin(request)}?{query}|{headers}'.encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    key = f'{CACHE_PREFIX}:list:{version}:{digest}'
+    data = cache.get(key)
+    _increment(MISSES_KEY if data is None else HITS_KEY)
+    return key, data
+
+
+def set_list_data(key, data):
+    get_cache().set(key, data, settings.RECIPE_CACHE_TIMEOUT)
+
+
+def _get_detail_version_key(pk):
+    return f'{CACHE_PREFIX}:detail_version:{pk}'
+
+
+def get_detail_data(request, pk):
+    cache = get_cache()
+    version = cache.get_or_set(_get_detail_version_key(pk), 0, None)
+    digest = md5(
+        _get_representation(request).encode(), usedforsecurity=False
+    ).hexdigest()
+    key = f'{CACHE_PREFIX}:detail:{pk}:{version}:{digest}'
+    data = cache.get(key)
+    _increment(MISSES_KEY if data is None else HITS_KEY)
+    return key, data
+
+
+def set_detail_data(key, data):
+    get_cache().set(key, data, settings.RECIPE_CACHE_TIMEOUT)
+
+
+def get_stats():
+    stats = get_cache().get_many((HITS_KEY, MISSES_KEY))
+    return {
+        'hits': stats.get(HITS_KEY, 0),
+        'misses': stats.get(MISSES_KEY, 0),
+    }
+
+
+def invalidate_recipes(recipe_ids):
+    # Новая версия рецепта берётся из счётчика списков: она больше любой
+    # прежней, и ответ, посчитанный до инвалидации, ляжет под мёртвый ключ.
+    version = _increment(LIST_VERSION_KEY)
+    get_cache().set_many(
+        {_get_detail_version_key(pk): version for pk in recipe_ids}, None
+    )
+
+
+def _flush_invalidations():
+    recipe_ids = connection.pending_recipe_invalidations
+    connection.pending_recipe_invalidations = set()
+    if recipe_ids:
+        invalidate_recipes(sorted(recipe_ids))
+
+
+def schedule_invalidation(recipe_ids):
+    """Сбрасывает кэш рецептов после коммита, один раз на транзакцию.
+
+    До коммита другие запросы видят старые строки и сохранили бы их
+    под новой версией.
+    """
+    if not hasattr(connection, 'pending_recipe_invalidations'):
+        connection.pending_recipe_invalidations = set()
+    connection.pending_recipe_invalidations.update(recipe_ids)
+    transaction.on_commit(_flush_invalidations)
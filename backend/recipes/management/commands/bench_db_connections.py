@@ -0,0 +1,44 @@
+from statistics import mean, quantiles
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from recipes.models import Recipe
+
+
+def measure(iterations, reconnect):
+    timings = []
+    for _ in range(iterations):
+        if reconnect:
+            connection.close()
+        started = perf_counter()
+        close_old_connections()
+        Recipe.objects.order_by('id').first()
+        timings.append((perf_counter() - started) * 1000)
+    return timings
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-request latency with a new connection per request '
+        'and with a persistent connection'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        self.stdout.write(
+            f'{connection.vendor} {connection.settings_dict["HOST"]} '
+            f'CONN_MAX_AGE={connection.settings_dict["CONN_MAX_AGE"]}'
+        )
+        for label, reconnect in (('new connection', True),
+                                 ('persistent', False)):
+            timings = measure(iterations, reconnect)
+            percentiles = quantiles(timings, n=100)
+            self.stdout.write(
+                f'{label:>15}: mean {mean(timings):.2f} ms, '
+                f'p50 {percentiles[49]:.2f} ms, p95 {percentiles[94]:.2f} ms'
+            )
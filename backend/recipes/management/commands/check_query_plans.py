@@ -0,0 +1,92 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from recipes.models import (
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartTotal,
+)
+from recipes.search import search_recipes
+from users.models import Subscription, User
+
+
+def get_hot_queries(user):
+    return {
+        'author feed': Recipe.objects.filter(author=user).order_by('id'),
+        'recipe flags': Recipe.objects.with_user_flags(user).filter(pk=1),
+        'is_favorited filter': Recipe.objects.filter(
+            favorited_by__user=user
+        ),
+        'is_in_shopping_cart filter': Recipe.objects.filter(
+            in_shopping_cart__user=user
+        ),
+        'subscriptions': User.objects.filter(subscribers__user=user),
+        'subscribers': Subscription.objects.filter(
+            author=user
+        ).values_list('user_id', flat=True),
+        'favorited by': Favorite.objects.filter(
+            recipe_id=1
+        ).values_list('user_id', flat=True),
+        'carts with recipe': ShoppingCart.objects.filter(
+            recipe_id=1
+        ).values_list('user_id', flat=True),
+        'recipe amounts': RecipeIngredient.objects.filter(
+            recipe_id=1
+        ).values_list('ingredient_id', 'amount'),
+        'shopping list aggregation': RecipeIngredient.objects.filter(
+            recipe__in_shopping_cart__user=user
+        ).values_list('ingredient_id').annotate(total=Sum('amount')),
+        'shopping list totals': ShoppingCartTotal.objects.filter(user=user),
+        'recipe search': search_recipes(Recipe.objects.all(), 'суп'),
+    }
+
+
+def iter_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from iter_nodes(child)
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the hot queries on PostgreSQL and fail if any of them '
+        'has to scan a whole table'
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans are only checked on PostgreSQL')
+        user = User(pk=1)
+        failures = []
+        for name, queryset in get_hot_queries(user).items():
+            # На маленькой базе планировщик и так выбирает Seq Scan,
+            # поэтому проверяется, что для запроса вообще есть индекс.
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = json.loads(queryset.explain(format='json'))
+            nodes = list(iter_nodes(plan[0]['Plan']))
+            seq_scans = sorted({
+                node['Relation Name'] for node in nodes
+                if node['Node Type'] == 'Seq Scan'
+            })
+            indexes = sorted({
+                node['Index Name'] for node in nodes if 'Index Name' in node
+            })
+            if seq_scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: seq scan on {", ".join(seq_scans)}'
+                ))
+            else:
+                self.stdout.write(f'{name}: {", ".join(indexes)}')
+        if failures:
+            raise CommandError(
+                f'{len(failures)} queries are not served by an index'
+            )
+        self.stdout.write(self.style.SUCCESS('All hot queries use indexes'))
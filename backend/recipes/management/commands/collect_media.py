@@ -0,0 +1,84 @@
+import os
+from collections import Counter
+from time import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from users.models import User
+
+MEDIA_DIRECTORIES = ('recipes/images', 'users/avatars')
+DEFAULT_MIN_AGE = 60 * 60
+
+
+def iter_files(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield os.path.join(directory, name)
+    for name in directories:
+        yield from iter_files(storage, os.path.join(directory, name))
+
+
+def iter_variant_names(variants):
+    for variant, files in variants.items():
+        if variant != 'source':
+            yield from files.values()
+
+
+def count_references():
+    references = Counter()
+    for image, variants in Recipe.objects.values_list(
+        'image', 'image_variants'
+    ):
+        references[image] += 1
+        references.update(iter_variant_names(variants))
+    for avatar, variants in User.objects.values_list(
+        'avatar', 'avatar_variants'
+    ):
+        references[avatar] += 1
+        references.update(iter_variant_names(variants))
+    return references
+
+
+class Command(BaseCommand):
+    help = 'Delete media files that are not referenced by any model'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=DEFAULT_MIN_AGE,
+            help='Keep unreferenced files younger than this many seconds',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report files that would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        references = count_references()
+        threshold = time() - options['min_age']
+        kept = shared = deleted = freed = 0
+        for directory in MEDIA_DIRECTORIES:
+            for name in iter_files(storage, directory):
+                if references[name]:
+                    kept += 1
+                    shared += references[name] > 1
+                    continue
+                if storage.get_modified_time(name).timestamp() > threshold:
+                    kept += 1
+                    continue
+                deleted += 1
+                freed += storage.size(name)
+                if not options['dry_run']:
+                    storage.delete(name)
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{deleted} files deleted ({freed} bytes), '
+            f'{kept} kept, {shared} shared by several objects'
+        ))
@@ -1,24 +1,135 @@
+import csv
 import json
 import os
+from time import perf_counter
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.autocomplete import ingredient_index
 from recipes.models import Ingredient
 
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(path):
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as file:
+        buffer = ''
+        started = False
+        while True:
+            chunk = file.read(READ_CHUNK_SIZE)
+            buffer += chunk
+            while True:
+                buffer = buffer.lstrip()
+                if not started:
+                    if not buffer:
+                        break
+                    if buffer[0] != '[':
+                        raise CommandError(f'{path}: expected a JSON array')
+                    buffer = buffer[1:]
+                    started = True
+                    continue
+                if buffer.startswith(','):
+                    buffer = buffer[1:]
+                    continue
+                if buffer.startswith(']'):
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    break
+                yield item['name'], item['measurement_unit']
+                buffer = buffer[end:]
+            if not chunk:
+                raise CommandError(f'{path}: unexpected end of JSON array')
+
+
+def iter_csv(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if row:
+                name, measurement_unit = row
+                yield name, measurement_unit
+
+
+READERS = {
+    '.json': iter_json,
+    '.csv': iter_csv,
+}
+
 
 class Command(BaseCommand):
-    help = 'Load ingredients from JSON file'
+    help = 'Load ingredients from a JSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=DEFAULT_PATH,
+            help='JSON or CSV file with ingredients',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of rows per INSERT/UPDATE statement',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would change without writing to the database',
+        )
 
     def handle(self, *args, **options):
-        path = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
-        with open(path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            for item in data:
-                Ingredient.objects.get_or_create(
-                    name=item['name'],
-                    measurement_unit=item['measurement_unit'],
-                )
-        self.stdout.write(
-            self.style.SUCCESS('Successfully loaded ingredients')
+        path = options['path']
+        batch_size = options['batch_size']
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in READERS:
+            raise CommandError(f'Unsupported file type: {extension}')
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+        started = perf_counter()
+
+        units = {}
+        for name, measurement_unit in READERS[extension](path):
+            units.setdefault(name.strip(), measurement_unit.strip())
+        existing = dict(
+            Ingredient.objects.values_list('name', 'measurement_unit')
         )
+        to_create = [
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in units.items()
+            if name not in existing
+        ]
+        changed_names = [
+            name for name, measurement_unit in units.items()
+            if name in existing and existing[name] != measurement_unit
+        ]
+
+        if not options['dry_run']:
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(
+                    to_create, batch_size=batch_size, ignore_conflicts=True
+                )
+                to_update = list(
+                    Ingredient.objects.filter(name__in=changed_names)
+                )
+                for ingredient in to_update:
+                    ingredient.measurement_unit = units[ingredient.name]
+                Ingredient.objects.bulk_update(
+                    to_update, ['measurement_unit'], batch_size=batch_size
+                )
+            if to_create or changed_names:
+                ingredient_index.invalidate()
+
+        elapsed = perf_counter() - started
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{len(units)} ingredients read, '
+            f'{len(to_create)} created, {len(changed_names)} updated, '
+            f'{len(units) - len(to_create) - len(changed_names)} unchanged '
+            f'in {elapsed:.3f}s'
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    help = 'Rebuild shopping cart totals and verify them against carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only verify the stored totals, do not rebuild them',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            count = ShoppingCartTotal.objects.rebuild()
+            self.stdout.write(f'Rebuilt {count} shopping cart totals')
+
+        expected = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingCartTotal.objects.live_totals()
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingCartTotal.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        mismatches = [
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        ]
+        if mismatches:
+            raise CommandError(
+                f'{len(mismatches)} shopping cart totals do not match carts'
+            )
+        self.stdout.write(
+            self.style.SUCCESS('Shopping cart totals match carts')
+        )
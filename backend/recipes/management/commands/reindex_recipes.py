@@ -0,0 +1,25 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import cache as recipe_cache
+from recipes.search import REINDEX_BATCH_SIZE, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=REINDEX_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        with transaction.atomic():
+            count = rebuild_search_index(options['batch_size'])
+        recipe_cache.invalidate_recipes([])
+        self.stdout.write(self.style.SUCCESS(
+            f'Reindexed {count} recipes in {perf_counter() - started:.2f} s'
+        ))
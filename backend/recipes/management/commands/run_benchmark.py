@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.benchmark import (
+    DEFAULT_MIX,
+    DEFAULT_TOKENS_PATH,
+    PERCENTILES,
+    compare,
+    run,
+)
+
+# Бенчмарк запускается из checkout: базовая линия лежит в data/ в корне.
+DEFAULT_BASELINE_PATH = os.path.join(
+    settings.BASE_DIR.parent, 'data', 'benchmark_baseline.json'
+)
+
+
+def parse_mix(value):
+    try:
+        mix = {
+            name: int(weight)
+            for name, weight in (
+                item.split('=') for item in value.split(',')
+            )
+        }
+    except ValueError:
+        raise CommandError(f'Invalid --mix: {value}')
+    unknown = mix.keys() - DEFAULT_MIX.keys()
+    if unknown:
+        raise CommandError(f'Unknown scenarios: {", ".join(unknown)}')
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a scenario mix against a running server and compare '
+        'latency and queries per request with a baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000')
+        parser.add_argument('--tokens-file', default=DEFAULT_TOKENS_PATH)
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument(
+            '--anonymous', type=float, default=0.3,
+            help='Share of virtual users without a token',
+        )
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+            help='Scenario weights, e.g. feed=5,autocomplete=3',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Write the results as the new baseline',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed p95 growth over the baseline',
+        )
+        parser.add_argument('--output', help='Write the results as JSON')
+
+    def handle(self, *args, **options):
+        if not options['save_baseline'] and not os.path.exists(
+            options['baseline']
+        ):
+            raise CommandError(
+                f'No baseline at {options["baseline"]}, '
+                'create it with --save-baseline'
+            )
+        tokens = []
+        if os.path.exists(options['tokens_file']):
+            with open(options['tokens_file'], encoding='utf-8') as file:
+                tokens = [item['token'] for item in json.load(file)]
+        try:
+            results = asyncio.run(run(
+                options['url'],
+                tokens,
+                parse_mix(options['mix']),
+                options['duration'],
+                options['concurrency'],
+                options['anonymous'],
+                options['seed'],
+            ))
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        self.print_results(results)
+
+        if options['output']:
+            self.write(options['output'], results)
+        if options['save_baseline']:
+            self.write(options['baseline'], results)
+            self.stdout.write(f'Baseline saved to {options["baseline"]}')
+            return
+        with open(options['baseline'], encoding='utf-8') as file:
+            regressions = compare(
+                results, json.load(file), options['tolerance']
+            )
+        if regressions:
+            raise CommandError(
+                'Regressions against the baseline:\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def print_results(self, results):
+        columns = ('requests', 'errors', 'rps', 'mean_ms') + tuple(
+            f'p{percent}_ms' for percent in PERCENTILES
+        ) + ('queries',)
+        self.stdout.write(
+            f'{"endpoint":<32}'
+            + ''.join(f'{column:>10}' for column in columns)
+        )
+        for name, values in results['endpoints'].items():
+            self.stdout.write(f'{name:<32}' + ''.join(
+                f'{"-" if values[column] is None else values[column]:>10}'
+                for column in columns
+            ))
+        total = sum(
+            values['requests'] for values in results['endpoints'].values()
+        )
+        self.stdout.write(
+            f'{total} requests in {results["elapsed"]} s, '
+            f'{total / results["elapsed"]:.1f} rps'
+        )
+
+    def write(self, path, results):
+        try:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+                file.write('\n')
+        except OSError as error:
+            raise CommandError(error)
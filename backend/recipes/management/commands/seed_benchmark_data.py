@@ -0,0 +1,180 @@
+import io
+import json
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from recipes import cache as recipe_cache
+from recipes.benchmark import DEFAULT_TOKENS_PATH
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartTotal,
+)
+from recipes.search import rebuild_search_index
+from users.models import Subscription
+
+User = get_user_model()
+
+USERNAME_PREFIX = 'bench_'
+PASSWORD = 'bench-password'
+BATCH_SIZE = 1000
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+    return default_storage.save(
+        'recipes/images/bench.png', ContentFile(buffer.getvalue())
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed users, recipes, favorites, shopping carts and subscriptions '
+        'for benchmarks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=10,
+                            help='Recipes per user')
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='Ingredients per recipe')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Favorites per user')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Shopping cart recipes per user')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Subscriptions per user')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--tokens-file', default=DEFAULT_TOKENS_PATH)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Delete previously seeded users and their data first',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'No ingredients, run load_ingredients first'
+            )
+        if options['clear']:
+            deleted, _ = User.objects.filter(
+                username__startswith=USERNAME_PREFIX
+            ).delete()
+            self.stdout.write(f'Deleted {deleted} objects')
+        elif User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).exists():
+            raise CommandError('Benchmark data already exists, use --clear')
+
+        rng = random.Random(options['seed'])
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{USERNAME_PREFIX}{number}',
+                    email=f'{USERNAME_PREFIX}{number}@example.com',
+                    first_name='Bench',
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in range(options['users'])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).values_list('id', flat=True))
+        tokens = [
+            Token(user_id=user_id, key=Token.generate_key())
+            for user_id in user_ids
+        ]
+        Token.objects.bulk_create(tokens, batch_size=BATCH_SIZE)
+
+        image = make_image()
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=user_id,
+                    name=f'Рецепт {user_id}-{number}',
+                    image=image,
+                    text='Рецепт для нагрузочного тестирования.',
+                    cooking_time=rng.randint(5, 120),
+                )
+                for user_id in user_ids
+                for number in range(options['recipes'])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        recipe_ids = list(Recipe.objects.filter(
+            author_id__in=user_ids
+        ).values_list('id', flat=True))
+        per_recipe = min(options['ingredients'], len(ingredient_ids))
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in rng.sample(ingredient_ids, per_recipe)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+        for model, count in (
+            (Favorite, options['favorites']),
+            (ShoppingCart, options['cart']),
+        ):
+            count = min(count, len(recipe_ids))
+            model.objects.bulk_create(
+                (
+                    model(user_id=user_id, recipe_id=recipe_id)
+                    for user_id in user_ids
+                    for recipe_id in rng.sample(recipe_ids, count)
+                ),
+                batch_size=BATCH_SIZE,
+            )
+        Subscription.objects.bulk_create(
+            (
+                Subscription(user_id=user_id, author_id=author_id)
+                for user_id in user_ids
+                for author_id in rng.sample(
+                    user_ids, min(options['subscriptions'], len(user_ids))
+                )
+                if author_id != user_id
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        ShoppingCartTotal.objects.rebuild()
+        rebuild_search_index()
+        transaction.on_commit(lambda: recipe_cache.invalidate_recipes([]))
+
+        with open(options['tokens_file'], 'w', encoding='utf-8') as file:
+            json.dump(
+                [
+                    {'id': token.user_id, 'token': token.key}
+                    for token in tokens
+                ],
+                file,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(user_ids)} users and {len(recipe_ids)} recipes, '
+            f'tokens written to {options["tokens_file"]}'
+        ))
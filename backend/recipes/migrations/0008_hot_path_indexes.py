@@ -0,0 +1,130 @@
+# Generated by Django 4.2.5 on 2026-10-18 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+APP_LABEL = 'recipes'
+REDUNDANT_FK_INDEXES = (
+    ('favorite', 'recipe'),
+    ('favorite', 'user'),
+    ('recipe', 'author'),
+    ('recipeingredient', 'recipe'),
+    ('shoppingcart', 'recipe'),
+    ('shoppingcart', 'user'),
+)
+
+
+def get_fk_indexes(schema_editor, model, column):
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(
+            cursor, model._meta.db_table
+        )
+    return [
+        name for name, info in constraints.items()
+        if info['index'] and not info['unique'] and not info['primary_key']
+        and info['columns'] == [column]
+    ]
+
+
+def drop_fk_indexes(apps, schema_editor):
+    for model_name, field_name in REDUNDANT_FK_INDEXES:
+        model = apps.get_model(APP_LABEL, model_name)
+        column = model._meta.get_field(field_name).column
+        for name in get_fk_indexes(schema_editor, model, column):
+            schema_editor.execute(schema_editor.sql_delete_index % {
+                'table': schema_editor.quote_name(model._meta.db_table),
+                'name': schema_editor.quote_name(name),
+            })
+
+
+def restore_fk_indexes(apps, schema_editor):
+    for model_name, field_name in REDUNDANT_FK_INDEXES:
+        model = apps.get_model(APP_LABEL, model_name)
+        column = model._meta.get_field(field_name).column
+        if not get_fk_indexes(schema_editor, model, column):
+            schema_editor.add_index(model, models.Index(
+                fields=[field_name],
+                name=f'{model._meta.db_table}_{column}_idx'[:30],
+            ))
+
+
+def create_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipe_ingredient_covering_idx '
+        'ON recipes_recipeingredient (recipe_id, ingredient_id) '
+        'INCLUDE (amount)'
+    )
+
+
+def drop_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS recipe_ingredient_covering_idx'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0007_shortlink'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_covering_index, drop_covering_index),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'id'], name='recipe_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['recipe', 'user'], name='cart_recipe_user_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    drop_fk_indexes, restore_fk_indexes
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='favorite',
+                    name='recipe',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='favorited_by', to='recipes.recipe'),
+                ),
+                migrations.AlterField(
+                    model_name='favorite',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='author',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта'),
+                ),
+                migrations.AlterField(
+                    model_name='recipeingredient',
+                    name='recipe',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipe_ingredients', to='recipes.recipe', verbose_name='Рецепт'),
+                ),
+                migrations.AlterField(
+                    model_name='shoppingcart',
+                    name='recipe',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='in_shopping_cart', to='recipes.recipe'),
+                ),
+                migrations.AlterField(
+                    model_name='shoppingcart',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+    ]
@@ -1,6 +1,13 @@
+from collections import Counter
+
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Exists, OuterRef, Sum, Value
+from django.utils import timezone
+
+from foodgram.querysets import RelationQuerySet
 
 
 class Ingredient(models.Model):
@@ -22,6 +29,44 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def lock(self, ids):
+        """Блокирует рецепты до конца транзакции.
+
+        Состав рецепта и корзины с ним меняются под этой блокировкой,
+        иначе итоги списков покупок считаются по чужим старым данным.
+        NO KEY UPDATE не конфликтует с блокировкой, которую берёт вставка
+        строки корзины по внешнему ключу.
+        """
+        return list(self.select_for_update(no_key=True).filter(
+            pk__in=ids
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def touch(self):
+        return self.update(updated_at=timezone.now())
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
+
+class RecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+    def get_queryset(self):
+        # Поисковый вектор нужен только в SQL и не грузится с рецептами.
+        return super().get_queryset().defer('search_vector')
+
+
 class Recipe(models.Model):
     name = models.CharField(
         max_length=255,
@@ -31,6 +76,7 @@ class Recipe(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='recipes',
+        db_index=False,
         verbose_name='Автор рецепта'
     )
     ingredients = models.ManyToManyField(
@@ -43,16 +89,38 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Изображение'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Варианты изображения'
+    )
     text = models.TextField(verbose_name='Описание')
     cooking_time = models.PositiveSmallIntegerField(
         validators=[MinValueValidator(1)],
         verbose_name='Время приготовления (в минутах)'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipeManager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['author', 'id'], name='recipe_author_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -63,6 +131,7 @@ class RecipeIngredient(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='recipe_ingredients',
+        db_index=False,
         verbose_name='Рецепт'
     )
     ingredient = models.ForeignKey(
@@ -89,16 +158,25 @@ class Favorite(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='favorites'
+        related_name='favorites',
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
-        related_name='favorited_by'
+        related_name='favorited_by',
+        db_index=False
     )
 
+    objects = RelationQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'recipe')
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='favorite_recipe_user_idx'
+            ),
+        ]
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные рецепты'
 
@@ -107,15 +185,216 @@ class ShoppingCart(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='shopping_cart'
+        related_name='shopping_cart',
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
-        related_name='in_shopping_cart'
+        related_name='in_shopping_cart',
+        db_index=False
     )
 
+    objects = RelationQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'recipe')
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='cart_recipe_user_idx'
+            ),
+        ]
         verbose_name = 'Покупка'
         verbose_name_plural = 'Список покупок'
+
+
+class ShoppingCartTotalQuerySet(models.QuerySet):
+    def _add_amounts(self, rows):
+        # Новая строка итога может появиться одновременно в двух запросах,
+        # поэтому сложение делает сама база: INSERT ... ON CONFLICT DO
+        # UPDATE (PostgreSQL и SQLite). Порядок строк один и тот же, чтобы
+        # параллельные вставки не ждали друг друга по кругу.
+        rows = sorted(rows)
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        batch_size = connection.ops.bulk_batch_size(
+            ['user_id', 'ingredient_id', 'amount'], rows
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                    f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                    'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                    f'SET amount = {table}.amount + EXCLUDED.amount',
+                    [value for row in batch for value in row],
+                )
+
+    def _subtract_amounts(self, user_ids, deltas):
+        to_update, to_delete = [], []
+        for row in self.select_for_update().filter(
+            user_id__in=user_ids, ingredient_id__in=deltas
+        ).order_by('user_id', 'ingredient_id'):
+            row.amount += deltas[row.ingredient_id]
+            if row.amount > 0:
+                to_update.append(row)
+            else:
+                to_delete.append(row.pk)
+        self.bulk_update(to_update, ['amount'])
+        self.filter(pk__in=to_delete).delete()
+
+    def _apply_deltas(self, user_ids, deltas):
+        if not user_ids:
+            return
+        added = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta > 0
+        }
+        removed = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta < 0
+        }
+        with transaction.atomic(using=self.db):
+            if added:
+                self._add_amounts([
+                    (user_id, ingredient_id, delta)
+                    for user_id in user_ids
+                    for ingredient_id, delta in added.items()
+                ])
+            if removed:
+                self._subtract_amounts(user_ids, removed)
+
+    @staticmethod
+    def _get_recipe_amounts(recipe):
+        return Counter(dict(
+            recipe.recipe_ingredients.values_list('ingredient_id', 'amount')
+        ))
+
+    def add_recipe(self, user, recipe):
+        self._apply_deltas([user.id], self._get_recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        self._apply_deltas([user.id], {
+            ingredient_id: -amount
+            for ingredient_id, amount in self._get_recipe_amounts(
+                recipe
+            ).items()
+        })
+
+    @staticmethod
+    def _get_recipes_amounts(recipe_ids):
+        if not recipe_ids:
+            return Counter()
+        return Counter(dict(
+            RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('ingredient_id').annotate(
+                total_amount=Sum('amount')
+            ).order_by()
+        ))
+
+    def change_cart(self, user, added_ids=(), removed_ids=()):
+        deltas = self._get_recipes_amounts(added_ids)
+        deltas.subtract(self._get_recipes_amounts(removed_ids))
+        self._apply_deltas([user.id], deltas)
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        deltas = Counter(new_amounts)
+        deltas.subtract(old_amounts)
+        user_ids = list(
+            recipe.in_shopping_cart.values_list('user_id', flat=True)
+        )
+        self._apply_deltas(user_ids, deltas)
+
+    def discard_recipe(self, recipe):
+        Recipe.objects.lock([recipe.pk])
+        self.change_recipe(recipe, self._get_recipe_amounts(recipe), {})
+
+    @transaction.atomic
+    def count_cart_row(self, cart, sign):
+        """Учитывает строку корзины: 1 — добавлена, -1 — удалена."""
+        Recipe.objects.lock([cart.recipe_id])
+        self._apply_deltas([cart.user_id], {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in self._get_recipes_amounts(
+                [cart.recipe_id]
+            ).items()
+        })
+
+    @transaction.atomic
+    def count_recipe_row(self, row, sign):
+        """Учитывает ингредиент рецепта во всех корзинах с этим рецептом."""
+        Recipe.objects.lock([row.recipe_id])
+        user_ids = list(ShoppingCart.objects.filter(
+            recipe_id=row.recipe_id
+        ).values_list('user_id', flat=True))
+        self._apply_deltas(user_ids, {row.ingredient_id: sign * row.amount})
+
+    def live_totals(self):
+        return RecipeIngredient.objects.filter(
+            recipe__in_shopping_cart__isnull=False
+        ).values_list(
+            'recipe__in_shopping_cart__user_id', 'ingredient_id'
+        ).annotate(total_amount=Sum('amount')).order_by()
+
+    @transaction.atomic
+    def rebuild(self):
+        self.all().delete()
+        return len(self.bulk_create(
+            self.model(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for user_id, ingredient_id, amount in self.live_totals()
+        ))
+
+
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = ShoppingCartTotalQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('user', 'ingredient')
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+
+    def __str__(self):
+        return f'{self.user} — {self.ingredient}: {self.amount}'
+
+
+class ShortLink(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='short_link',
+        verbose_name='Рецепт'
+    )
+    code = models.CharField(
+        max_length=16,
+        unique=True,
+        verbose_name='Код'
+    )
+    hits = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Переходы'
+    )
+
+    class Meta:
+        verbose_name = 'Короткая ссылка'
+        verbose_name_plural = 'Короткие ссылки'
+
+    def __str__(self):
+        return self.code
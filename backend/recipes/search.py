@@ -0,0 +1,172 @@
+"""Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+В PostgreSQL у рецепта хранится взвешенный tsvector с GIN-индексом,
+в SQLite — строка в виртуальной таблице FTS5 с rowid рецепта. Индекс
+обновляется сигналами после коммита и пересобирается командой
+reindex_recipes.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Replace
+
+from .models import Ingredient, Recipe, RecipeIngredient
+
+FTS_TABLE = 'recipes_recipe_search'
+# Веса колонок FTS5 в порядке name, ingredients, text — как A, B, C.
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+TERM_PATTERN = re.compile(r'[^\W_]+')
+MAX_TERMS = 10
+REINDEX_BATCH_SIZE = 500
+
+
+def get_terms(value):
+    # «ё» ни FTS5, ни словари PostgreSQL не сводят к «е».
+    value = value.casefold().replace('ё', 'е')
+    return TERM_PATTERN.findall(value)[:MAX_TERMS]
+
+
+def fold_yo(expression):
+    for old, new in (('ё', 'е'), ('Ё', 'Е')):
+        expression = Replace(
+            expression, Value(old), Value(new), output_field=TextField()
+        )
+    return expression
+
+
+def fold_yo_sql(column):
+    return f"REPLACE(REPLACE({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def get_search_vector():
+    config = settings.SEARCH_CONFIG
+    ingredient_names = Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    return (
+        SearchVector(fold_yo(F('name')), weight='A', config=config)
+        + SearchVector(fold_yo(ingredient_names), weight='B', config=config)
+        + SearchVector(fold_yo(F('text')), weight='C', config=config)
+    )
+
+
+def search_recipes(queryset, value):
+    """Рецепты по словам запроса, от самых релевантных.
+
+    Каждое слово ищется как префикс, все слова обязательны.
+    """
+    terms = get_terms(value)
+    if not terms:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            config=settings.SEARCH_CONFIG,
+            search_type='raw',
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', 'id')
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        table = Recipe._meta.db_table
+        weights = ', '.join(map(str, FTS_WEIGHTS))
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            (match,),
+        )).order_by('-search_rank', 'id')
+    for term in terms:
+        queryset = queryset.filter(name__icontains=term)
+    return queryset
+
+
+def update_search_index(recipe_ids):
+    """Пересчитывает поисковые данные рецептов."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=get_search_vector()
+        )
+    elif connection.vendor == 'sqlite':
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        columns = ', '.join(map(fold_yo_sql, (
+            'r.name', "COALESCE(GROUP_CONCAT(i.name, ' '), '')", 'r.text'
+        )))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                recipe_ids,
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+                f'SELECT r.id, {columns} '
+                f'FROM {Recipe._meta.db_table} r '
+                f'LEFT JOIN {RecipeIngredient._meta.db_table} ri '
+                'ON ri.recipe_id = r.id '
+                f'LEFT JOIN {Ingredient._meta.db_table} i '
+                'ON i.id = ri.ingredient_id '
+                f'WHERE r.id IN ({placeholders}) GROUP BY r.id',
+                recipe_ids,
+            )
+
+
+def remove_from_search_index(recipe_ids):
+    # В PostgreSQL вектор удаляется вместе со строкой рецепта.
+    if connection.vendor != 'sqlite':
+        return
+    recipe_ids = list(recipe_ids)
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            recipe_ids,
+        )
+
+
+def _flush_search_updates():
+    recipe_ids = connection.pending_search_updates
+    connection.pending_search_updates = set()
+    update_search_index(sorted(recipe_ids))
+
+
+def schedule_search_update(recipe_ids):
+    """Обновляет индекс после коммита, один раз на транзакцию.
+
+    id копятся на соединении: сохранение рецепта вместе с ингредиентами
+    даёт один проход по индексу, а не проход на каждую строку.
+    """
+    if not hasattr(connection, 'pending_search_updates'):
+        connection.pending_search_updates = set()
+    connection.pending_search_updates.update(recipe_ids)
+    transaction.on_commit(_flush_search_updates)
+
+
+def rebuild_search_index(batch_size=REINDEX_BATCH_SIZE):
+    recipe_ids = list(Recipe.objects.order_by('id').values_list(
+        'id', flat=True
+    ))
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    for start in range(0, len(recipe_ids), batch_size):
+        update_search_index(recipe_ids[start:start + batch_size])
+    return len(recipe_ids)
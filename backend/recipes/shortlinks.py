@@ -0,0 +1,119 @@
+import atexit
+import secrets
+import string
+from collections import Counter, OrderedDict
+from threading import Lock, Timer
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import ShortLink
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_LENGTH = 6
+MAX_ATTEMPTS = 5
+
+
+def generate_code():
+    return ''.join(secrets.choice(ALPHABET) for _ in range(CODE_LENGTH))
+
+
+def get_short_link(recipe):
+    link = ShortLink.objects.filter(recipe=recipe).first()
+    for _ in range(MAX_ATTEMPTS):
+        if link is not None:
+            return link
+        try:
+            with transaction.atomic():
+                return ShortLink.objects.create(
+                    recipe=recipe, code=generate_code()
+                )
+        except IntegrityError:
+            link = ShortLink.objects.filter(recipe=recipe).first()
+    raise RuntimeError('Не удалось создать короткую ссылку.')
+
+
+class ShortLinkResolver:
+    def __init__(self):
+        self._lock = Lock()
+        self._recipes = OrderedDict()
+
+    def _get(self, code):
+        with self._lock:
+            if code in self._recipes:
+                self._recipes.move_to_end(code)
+                return self._recipes[code]
+        return None
+
+    def _remember(self, code, recipe_id):
+        with self._lock:
+            self._recipes[code] = recipe_id
+            if len(self._recipes) > settings.SHORT_LINK_CACHE_SIZE:
+                self._recipes.popitem(last=False)
+
+    def _get_queryset(self, code):
+        return ShortLink.objects.filter(code=code).values_list(
+            'recipe_id', flat=True
+        )
+
+    def resolve(self, code):
+        recipe_id = self._get(code)
+        if recipe_id is None:
+            recipe_id = self._get_queryset(code).first()
+            if recipe_id is not None:
+                self._remember(code, recipe_id)
+        return recipe_id
+
+    async def aresolve(self, code):
+        recipe_id = self._get(code)
+        if recipe_id is None:
+            recipe_id = await self._get_queryset(code).afirst()
+            if recipe_id is not None:
+                self._remember(code, recipe_id)
+        return recipe_id
+
+    def forget(self, code):
+        with self._lock:
+            self._recipes.pop(code, None)
+
+
+class HitCounter:
+    def __init__(self):
+        self._lock = Lock()
+        self._hits = Counter()
+        self._timer = None
+
+    def add(self, code):
+        with self._lock:
+            self._hits[code] += 1
+            if self._timer is None:
+                self._timer = Timer(
+                    settings.SHORT_LINK_HITS_FLUSH_INTERVAL, self._flush
+                )
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            hits, self._hits = self._hits, Counter()
+            self._timer = None
+        if not hits:
+            return
+        ShortLink.objects.filter(code__in=hits).update(
+            hits=F('hits') + Case(*(
+                When(code=code, then=Value(count))
+                for code, count in hits.items()
+            ))
+        )
+
+    def _flush(self):
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+
+resolver = ShortLinkResolver()
+hit_counter = HitCounter()
+atexit.register(hit_counter.flush)
@@ -0,0 +1,150 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from . import cache
+from .autocomplete import ingredient_index
+from .models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartTotal,
+    ShortLink,
+)
+from .search import remove_from_search_index, schedule_search_update
+from .shortlinks import resolver
+
+AUTHOR_FIELDS = frozenset((
+    'email', 'username', 'first_name', 'last_name', 'avatar',
+    'avatar_variants',
+))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    # До коммита индекс пересобрался бы из старых строк под новой версией.
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    cache.schedule_invalidation([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredient(instance, **kwargs):
+    cache.schedule_invalidation([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipe_ingredients(instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Recipe):
+        cache.schedule_invalidation([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def invalidate_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        # ETag и Last-Modified рецепта строятся по updated_at, а в ответе
+        # есть название и единица ингредиента.
+        instance.recipes.touch()
+        recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+        cache.schedule_invalidation(recipe_ids)
+        schedule_search_update(recipe_ids)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def touch_ingredient_recipes(instance, **kwargs):
+    # Строки ингредиента в рецептах удалятся каскадом.
+    instance.recipes.touch()
+
+
+@receiver(post_save, sender=Recipe)
+def reindex_recipe(instance, **kwargs):
+    schedule_search_update([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(instance, **kwargs):
+    remove_from_search_index([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def reindex_recipe_ingredient(instance, origin=None, **kwargs):
+    # При удалении рецепта его ингредиенты удаляются каскадом.
+    if not isinstance(origin, Recipe):
+        schedule_search_update([instance.recipe_id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def discard_recipe_totals(instance, **kwargs):
+    # Корзины с рецептом удалятся каскадом, поэтому итоги пересчитываются
+    # до удаления, пока ингредиенты рецепта ещё на месте.
+    ShoppingCartTotal.objects.discard_recipe(instance)
+
+
+# Итоги списков покупок ведут сигналы сохранения и удаления отдельных строк
+# (админка, shell). Пакетные операции — bulk_create, bulk_update, delete()
+# на QuerySet и методы RelationQuerySet — пересчитывает вызывающий код.
+# Каскады не учитываются: рецепт учтён в discard_recipe_totals, а при
+# удалении пользователя или ингредиента строки итогов удаляются сами.
+@receiver(pre_save, sender=ShoppingCart)
+def discard_stored_cart(instance, **kwargs):
+    stored = instance.pk and ShoppingCart.objects.filter(
+        pk=instance.pk
+    ).first()
+    if stored:
+        ShoppingCartTotal.objects.count_cart_row(stored, -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def count_saved_cart(instance, **kwargs):
+    ShoppingCartTotal.objects.count_cart_row(instance, 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def discard_deleted_cart(instance, origin=None, **kwargs):
+    if origin is instance:
+        ShoppingCartTotal.objects.count_cart_row(instance, -1)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def discard_stored_recipe_ingredient(instance, **kwargs):
+    stored = instance.pk and RecipeIngredient.objects.filter(
+        pk=instance.pk
+    ).first()
+    if stored:
+        ShoppingCartTotal.objects.count_recipe_row(stored, -1)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def count_saved_recipe_ingredient(instance, **kwargs):
+    ShoppingCartTotal.objects.count_recipe_row(instance, 1)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def discard_deleted_recipe_ingredient(instance, origin=None, **kwargs):
+    if origin is instance:
+        ShoppingCartTotal.objects.count_recipe_row(instance, -1)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_author_recipes(instance, created, update_fields, **kwargs):
+    if created or (update_fields and AUTHOR_FIELDS.isdisjoint(update_fields)):
+        return
+    recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    if recipe_ids:
+        cache.schedule_invalidation(recipe_ids)
+
+
+@receiver(post_delete, sender=ShortLink)
+def forget_short_link(instance, **kwargs):
+    resolver.forget(instance.code)
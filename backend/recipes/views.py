@@ -0,0 +1,20 @@
+from django.http import Http404
+from django.shortcuts import redirect
+
+from .shortlinks import hit_counter, resolver
+
+
+def short_link_redirect(request, code):
+    recipe_id = resolver.resolve(code)
+    if recipe_id is None:
+        raise Http404('Короткая ссылка не найдена.')
+    hit_counter.add(code)
+    return redirect(f'/recipes/{recipe_id}')
+
+
+async def async_short_link_redirect(request, code):
+    recipe_id = await resolver.aresolve(code)
+    if recipe_id is None:
+        raise Http404('Короткая ссылка не найдена.')
+    hit_counter.add(code)
+    return redirect(f'/recipes/{recipe_id}')
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.5 on 2026-10-18 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+APP_LABEL = 'users'
+REDUNDANT_FK_INDEXES = (
+    ('subscription', 'author'),
+    ('subscription', 'user'),
+)
+
+
+def get_fk_indexes(schema_editor, model, column):
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(
+            cursor, model._meta.db_table
+        )
+    return [
+        name for name, info in constraints.items()
+        if info['index'] and not info['unique'] and not info['primary_key']
+        and info['columns'] == [column]
+    ]
+
+
+def drop_fk_indexes(apps, schema_editor):
+    for model_name, field_name in REDUNDANT_FK_INDEXES:
+        model = apps.get_model(APP_LABEL, model_name)
+        column = model._meta.get_field(field_name).column
+        for name in get_fk_indexes(schema_editor, model, column):
+            schema_editor.execute(schema_editor.sql_delete_index % {
+                'table': schema_editor.quote_name(model._meta.db_table),
+                'name': schema_editor.quote_name(name),
+            })
+
+
+def restore_fk_indexes(apps, schema_editor):
+    for model_name, field_name in REDUNDANT_FK_INDEXES:
+        model = apps.get_model(APP_LABEL, model_name)
+        column = model._meta.get_field(field_name).column
+        if not get_fk_indexes(schema_editor, model, column):
+            schema_editor.add_index(model, models.Index(
+                fields=[field_name],
+                name=f'{model._meta.db_table}_{column}_idx'[:30],
+            ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_user_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['author', 'user'], name='subscription_author_user_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    drop_fk_indexes, restore_fk_indexes
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='subscription',
+                    name='author',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='subscribers', to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+                ),
+                migrations.AlterField(
+                    model_name='subscription',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик'),
+                ),
+            ],
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.core.validators import RegexValidator
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
+from foodgram.querysets import RelationQuerySet
+
 
 class User(AbstractUser):
     username = models.CharField(
@@ -37,6 +39,16 @@ class User(AbstractUser):
         default='',
         verbose_name='Аватар'
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Варианты аватара'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -49,18 +61,23 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def touch(self):
+        self.save(update_fields=['updated_at'])
+
 
 class Subscription(models.Model):
     user = models.ForeignKey(
         'users.User',
         on_delete=models.CASCADE,
         related_name='subscriptions',
+        db_index=False,
         verbose_name='Подписчик'
     )
     author = models.ForeignKey(
         'users.User',
         on_delete=models.CASCADE,
         related_name='subscribers',
+        db_index=False,
         verbose_name='Автор'
     )
     created = models.DateTimeField(
@@ -68,8 +85,15 @@ class Subscription(models.Model):
         verbose_name='Дата создания'
     )
 
+    objects = RelationQuerySet.as_manager()
+
     class Meta:
         unique_together = ['user', 'author']
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='subscription_author_user_idx'
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 